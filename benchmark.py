@@ -0,0 +1,323 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional
+from clip_planner import plan_clips
+from heatmap import analyze_heatmap_data, parse_svg_heatmap
+from heatmap_array import HeatmapArray
+from sources import collect_video_ids, recorded_pages
+from transcript import get_significant_transcript_sections, parse_srt, to_seconds
+from utils import format_srt_timestamp, generate_srt, stream_clips_zip, write_clips_zip
+from video_processing import create_clips
+from watch_page import INITIAL_DATA_MARKERS, parse_most_replayed
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+DEFAULT_SIZES = [1, 10, 100]
+
+# Encoding cases get slow quickly, so they stop at this scale factor
+MAX_FFMPEG_SIZE = 10
+
+# Seconds of synthetic video per clip in the create_clips and ZIP cases
+SYNTHETIC_CLIP_SECONDS = 4
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    size: int
+    unit: str
+    items: int
+    repeats: int
+    min_seconds: float
+    median_seconds: float
+    throughput: float
+    peak_bytes: int
+    child_max_rss_kb: int = 0
+
+
+@dataclass
+class BenchmarkCase:
+    """`setup(size)` builds inputs offline; `run(inputs)` is the timed call; `items(inputs)` counts work units."""
+    name: str
+    unit: str
+    setup: Callable[[int], Any]
+    run: Callable[[Any], Any]
+    items: Callable[[Any], int]
+    needs_ffmpeg: bool = False
+    max_size: Optional[int] = None
+
+
+def _read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as fixture:
+        return fixture.read()
+
+
+def heatmap_svg(chapters: int) -> str:
+    """Combines `chapters` copies of the recorded chapter the way `extract_heatmap_svgs` does."""
+    chapter = _read_fixture("heatmap_chapter.svg")
+    group = chapter[chapter.index('<g'):chapter.rindex('</g>') + len('</g>')]
+    groups = [group.replace('translate(0, 0)', f'translate({i * 1000}, 0)') for i in range(chapters)]
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{chapters * 1000}px" height="100px" '
+            f'viewBox="0 0 {chapters * 1000} 100">' + ''.join(groups) + '</svg>')
+
+
+def watch_page_html(copies: int) -> str:
+    """The recorded watch page with its most-replayed markers repeated `copies` times, shifted so times keep increasing."""
+    page = _read_fixture("watch_page.html")
+    marker = next(marker for marker in INITIAL_DATA_MARKERS if marker in page)
+    begin = page.index(marker) + len(marker)
+    initial_data, end = json.JSONDecoder().raw_decode(page, begin)
+    markers_list = initial_data['frameworkUpdates']['entityBatchUpdate']['mutations'][0]['payload']['macroMarkersListEntity']['markersList']
+    base = markers_list['markers']
+    span = int(base[-1]['startMillis']) + int(base[-1]['durationMillis'])
+    markers_list['markers'] = [{**marker, 'startMillis': str(int(marker['startMillis']) + span * i)} for i in range(copies) for marker in base]
+    return page[:begin] + json.dumps(initial_data) + page[end:]
+
+
+def transcript_entries(copies: int) -> List[Dict[str, Any]]:
+    """Repeats the recorded JSON transcript `copies` times, shifted so times keep increasing."""
+    base = json.loads(_read_fixture("transcript.json"))
+    span = base[-1]['start'] + base[-1]['duration'] + 1
+    return [{**entry, 'start': entry['start'] + span * i} for i in range(copies) for entry in base]
+
+
+def srt_content(copies: int) -> str:
+    """Repeats the recorded SRT file `copies` times, renumbered and shifted so times keep increasing."""
+    recorded = [block.split('\n', 2) for block in _read_fixture("transcript.srt").strip().split('\n\n')]
+    span = to_seconds(recorded[-1][1].split(' --> ')[1]) + 1
+    blocks = []
+    for i in range(copies):
+        for _, timing, text in recorded:
+            start, end = (format_srt_timestamp(to_seconds(timestamp) + span * i) for timestamp in timing.split(' --> '))
+            blocks.append(f"{len(blocks) + 1}\n{start} --> {end}\n{text}\n")
+    return "\n".join(blocks) + "\n"
+
+
+def synthetic_video(directory: str, seconds: int) -> str:
+    path = os.path.join(directory, f"synthetic_{seconds}s.mp4")
+    if not os.path.exists(path):
+        subprocess.run([
+            'ffmpeg', '-y', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', f'testsrc=duration={seconds}:size=320x240:rate=25',
+            '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-g', '50', '-c:a', 'aac', '-shortest', path
+        ], check=True)
+    return path
+
+
+def _clip_sections(clips: int) -> Dict[str, List[Dict[str, Any]]]:
+    # Same entry shape as youtube-transcript-api and json3 (start/duration), which the pipeline produces by default
+    entries = transcript_entries(1)[:3]
+    return {'rises': [{'start': i * SYNTHETIC_CLIP_SECONDS, 'end': (i + 1) * SYNTHETIC_CLIP_SECONDS - 0.5, 'text': entries}
+                      for i in range(clips)]}
+
+
+def build_cases(workdir: str) -> List[BenchmarkCase]:
+    def heatmap_setup(size):
+        # One recorded chapter stands for a minute of video
+        return {'svg': heatmap_svg(size), 'duration': size * 60.0, 'width': size * 1000, 'chapters': size}
+
+    def parse_heatmap(inputs):
+        return parse_svg_heatmap(inputs['svg'], inputs['duration'], svg_width=inputs['width'], svg_height=100)
+
+    def analyze_setup(size):
+        return parse_heatmap(heatmap_setup(size))
+
+    def plan_setup(size):
+        return HeatmapArray.from_points(analyze_setup(size)), size * 60.0
+
+    def short_plan_setup(size):
+        # Watch pages always carry 100 markers, so a very short video packs them closer than the smoothing window
+        heatmap, _ = plan_setup(size)
+        seconds = 4.0
+        return HeatmapArray(heatmap.times * (seconds / heatmap.times[-1]), heatmap.attention), seconds
+
+    def sections_setup(size):
+        points = analyze_setup(size)
+        transcript = transcript_entries(size * 4)
+        return transcript, analyze_heatmap_data(points)
+
+    def sources_setup(size):
+        # Each copy re-expands every recorded playlist, so most IDs are duplicates to skip
+        pages = recorded_pages(os.path.join(FIXTURES_DIR, "playlist_pages.json"))
+        with open(os.path.join(FIXTURES_DIR, "playlist_pages.json"), 'r', encoding='utf-8') as fixture:
+            playlist_urls = list(json.load(fixture)) * size
+        return playlist_urls, pages
+
+    def clips_setup(size):
+        video_path = synthetic_video(workdir, size * SYNTHETIC_CLIP_SECONDS)
+        output_dir = tempfile.mkdtemp(dir=workdir)
+        return video_path, _clip_sections(size), output_dir
+
+    def made_clips(size):
+        video_path, sections, output_dir = clips_setup(size)
+        return create_clips('bench', sections, video_path, output_dir, mode='copy')
+
+    def zip_to_disk(clips):
+        archive_dir = tempfile.mkdtemp(dir=workdir)
+        return write_clips_zip(clips, os.path.join(archive_dir, "clips.zip"))
+
+    return [
+        BenchmarkCase("parse_svg_heatmap", "points", heatmap_setup, parse_heatmap, lambda inputs: len(parse_heatmap(inputs))),
+        BenchmarkCase("parse_most_replayed", "points", watch_page_html, parse_most_replayed,
+                      lambda page: page.count('"startMillis"')),
+        BenchmarkCase("analyze_heatmap_data", "points", analyze_setup, analyze_heatmap_data, len),
+        BenchmarkCase("plan_clips", "points", plan_setup, lambda inputs: plan_clips(*inputs), lambda inputs: len(inputs[0])),
+        BenchmarkCase("plan_clips[short_video]", "points", short_plan_setup, lambda inputs: plan_clips(*inputs), lambda inputs: len(inputs[0])),
+        BenchmarkCase("get_significant_transcript_sections", "entries", sections_setup,
+                      lambda inputs: get_significant_transcript_sections(*inputs), lambda inputs: len(inputs[0])),
+        BenchmarkCase("collect_video_ids", "playlists", sources_setup,
+                      lambda inputs: collect_video_ids([], inputs[0], [], pages=inputs[1]), lambda inputs: len(inputs[0])),
+        BenchmarkCase("parse_srt", "entries", srt_content, parse_srt, lambda content: content.count(' --> ')),
+        BenchmarkCase("generate_srt", "entries", lambda size: transcript_entries(size), generate_srt, len),
+        BenchmarkCase("create_clips[copy]", "clips", clips_setup,
+                      lambda inputs: create_clips('bench', inputs[1], inputs[0], inputs[2], mode='copy'),
+                      lambda inputs: len(inputs[1]['rises']), needs_ffmpeg=True, max_size=MAX_FFMPEG_SIZE),
+        BenchmarkCase("create_clips[fast]", "clips", clips_setup,
+                      lambda inputs: create_clips('bench', inputs[1], inputs[0], inputs[2], mode='fast'),
+                      lambda inputs: len(inputs[1]['rises']), needs_ffmpeg=True, max_size=MAX_FFMPEG_SIZE),
+        BenchmarkCase("create_clips[fast,single_pass]", "clips", clips_setup,
+                      lambda inputs: create_clips('bench', inputs[1], inputs[0], inputs[2], mode='fast', single_pass=True),
+                      lambda inputs: len(inputs[1]['rises']), needs_ffmpeg=True, max_size=MAX_FFMPEG_SIZE),
+        BenchmarkCase("stream_clips_zip", "clips", made_clips, lambda clips: sum(len(chunk) for chunk in stream_clips_zip(clips)), len,
+                      needs_ffmpeg=True, max_size=MAX_FFMPEG_SIZE),
+        BenchmarkCase("write_clips_zip", "clips", made_clips, zip_to_disk, len, needs_ffmpeg=True, max_size=MAX_FFMPEG_SIZE),
+    ]
+
+
+def measure(case: BenchmarkCase, size: int, repeats: int) -> BenchmarkResult:
+    inputs = case.setup(size)
+    items = case.items(inputs)
+    case.run(inputs)  # warm-up
+
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        case.run(inputs)
+        timings.append(time.perf_counter() - started)
+    # Largest resident set of any ffmpeg child so far in this process
+    child_max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    # Peak memory is measured on a separate run because tracing slows the timed ones
+    gc.collect()
+    tracemalloc.start()
+    case.run(inputs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return BenchmarkResult(
+        name=case.name,
+        size=size,
+        unit=case.unit,
+        items=items,
+        repeats=repeats,
+        min_seconds=min(timings),
+        median_seconds=median,
+        throughput=items / median if median else 0.0,
+        peak_bytes=peak,
+        child_max_rss_kb=child_max_rss if case.needs_ffmpeg else 0
+    )
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes: List[int], repeats: int, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    has_ffmpeg = shutil.which('ffmpeg') is not None
+    results = []
+    workdir = tempfile.mkdtemp(prefix="shorts-bench-")
+    try:
+        for case in build_cases(workdir):
+            if only and not any(name in case.name for name in only):
+                continue
+            if case.needs_ffmpeg and not has_ffmpeg:
+                print(f"Skipping {case.name}: ffmpeg not found", file=sys.stderr)
+                continue
+            for size in sizes:
+                if case.max_size and size > case.max_size:
+                    print(f"Skipping {case.name} at size {size}: above its max size {case.max_size}", file=sys.stderr)
+                    continue
+                result = measure(case, size, repeats)
+                print(f"{result.name:<36} size={size:<5} {result.throughput:12.1f} {result.unit}/s  "
+                      f"median={result.median_seconds * 1000:9.2f} ms  peak={result.peak_bytes / 1024:9.1f} KiB", file=sys.stderr)
+                results.append(asdict(result))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeats': repeats,
+        },
+        'results': results
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Pairs results by (name, size) and reports the median time and peak memory ratios (current / baseline)."""
+    previous = {(result['name'], result['size']): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        before = previous.get((result['name'], result['size']))
+        if not before:
+            continue
+        rows.append({
+            'name': result['name'],
+            'size': result['size'],
+            'time_ratio': result['median_seconds'] / before['median_seconds'] if before['median_seconds'] else None,
+            'memory_ratio': result['peak_bytes'] / before['peak_bytes'] if before['peak_bytes'] else None,
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline performance benchmarks for each pipeline stage.")
+    parser.add_argument('--sizes', default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma-separated input scale factors")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--only', action='append', help="Run only cases whose name contains this text (repeatable)")
+    parser.add_argument('--output', help="Write the JSON results to this file instead of stdout")
+    parser.add_argument('--compare', help="Baseline JSON results to compare against")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks([int(size) for size in args.sizes.split(",")], args.repeats, args.only)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baseline_file:
+            report['comparison'] = compare(report, json.load(baseline_file))
+        for row in report['comparison']:
+            print(f"{row['name']:<36} size={row['size']:<5} time x{row['time_ratio'] or 0:.2f}  memory x{row['memory_ratio'] or 0:.2f}",
+                  file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(report, output_file, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import random
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+from playwright.async_api import async_playwright, Error as PlaywrightError
+from metrics import get_metrics
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edge/91.0.864.59 Safari/537.36"
+]
+
+RESOLUTIONS = [
+    {"width": 1024, "height": 768},
+    {"width": 1280, "height": 720},
+    {"width": 1366, "height": 768},
+    {"width": 1440, "height": 900},
+    {"width": 1600, "height": 900}
+]
+
+BROWSERS = ["chromium"]
+
+LAUNCH_ARGS = ["--disable-gpu", "--no-sandbox", "--disable-dev-shm-usage", "--disable-extensions", "--disable-plugins"]
+
+BLOCKED_RESOURCE_TYPES = ["video", "audio", "font"]
+
+
+def install_browsers(browser_types: List[str] = BROWSERS) -> None:
+    """Downloads the Playwright browser builds; call explicitly at deploy time or app startup."""
+    subprocess.run([sys.executable, '-m', 'playwright', 'install', *browser_types], check=True)
+
+
+@dataclass
+class PoolStats:
+    launches: int = 0
+    contexts_created: int = 0
+    reuses: int = 0
+    recycles: int = 0
+    crashes: int = 0
+    acquisitions: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    @property
+    def average_wait_seconds(self) -> float:
+        return self.total_wait_seconds / self.acquisitions if self.acquisitions else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['average_wait_seconds'] = self.average_wait_seconds
+        return data
+
+
+class _Slot:
+    """One warm browser with a single reusable context."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.browser = None
+        self.context = None
+        self.uses = 0
+
+
+class BrowserPool:
+    """Keeps `size` warm browsers/contexts and hands out pages with bounded concurrency.
+
+    A context is recycled after `max_uses_per_context` pages or as soon as a page
+    using it raises, so a crashed renderer never leaks into the next video.
+    """
+
+    def __init__(self, size: int = 2, max_uses_per_context: int = 25, headless: bool = True):
+        if size < 1:
+            raise ValueError("Browser pool size must be at least 1")
+        self.size = size
+        self.max_uses_per_context = max_uses_per_context
+        self.headless = headless
+        self.stats = PoolStats()
+        self._playwright = None
+        self._slots: List[_Slot] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._start_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        async with self._start_lock:
+            if self._playwright is not None:
+                return
+            self._playwright = await async_playwright().start()
+            self._idle = asyncio.Queue()
+            self._slots = [_Slot(i) for i in range(self.size)]
+            for slot in self._slots:
+                self._idle.put_nowait(slot)
+            logging.info(f"Browser pool started with {self.size} slot(s)")
+
+    async def close(self) -> None:
+        for slot in self._slots:
+            await self._close_slot(slot)
+        self._slots = []
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        logging.info(f"Browser pool closed: {self.stats.to_dict()}")
+
+    async def __aenter__(self) -> "BrowserPool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    @asynccontextmanager
+    async def page(self):
+        """Yields a fresh page on a warm context, waiting for a free slot if needed."""
+        await self.start()
+        queued_at = time.perf_counter()
+        slot = await self._idle.get()
+        waited = time.perf_counter() - queued_at
+        self.stats.acquisitions += 1
+        self.stats.total_wait_seconds += waited
+        self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+        get_metrics().record('browser.acquire', waited)
+
+        page = None
+        crashed = False
+        try:
+            await self._ensure_context(slot)
+            page = await slot.context.new_page()
+            slot.uses += 1
+            yield page
+        except Exception:
+            crashed = True
+            self.stats.crashes += 1
+            get_metrics().increment('browser_crashes')
+            raise
+        finally:
+            if page is not None:
+                try:
+                    await page.close()
+                except PlaywrightError:
+                    crashed = True
+            if crashed or slot.uses >= self.max_uses_per_context:
+                self.stats.recycles += 1
+                await self._close_context(slot)
+                if crashed and slot.browser is not None and not slot.browser.is_connected():
+                    slot.browser = None
+            self._idle.put_nowait(slot)
+
+    async def _ensure_context(self, slot: _Slot) -> None:
+        if slot.browser is None or not slot.browser.is_connected():
+            browser_type = random.choice(BROWSERS)
+            with get_metrics().span('browser.launch', browser=browser_type):
+                slot.browser = await getattr(self._playwright, browser_type).launch(
+                    headless=self.headless,
+                    args=LAUNCH_ARGS
+                )
+            slot.context = None
+            self.stats.launches += 1
+            logging.info(f"Launched {browser_type} for pool slot {slot.index}")
+
+        if slot.context is None:
+            slot.context = await slot.browser.new_context(
+                user_agent=random.choice(USER_AGENTS),
+                viewport=random.choice(RESOLUTIONS),
+                locale="en-US",
+                ignore_https_errors=True,
+                java_script_enabled=True,
+                bypass_csp=True
+            )
+            await slot.context.route("**/*", lambda route: route.abort() if route.request.resource_type in BLOCKED_RESOURCE_TYPES else route.continue_())
+            slot.uses = 0
+            self.stats.contexts_created += 1
+        else:
+            self.stats.reuses += 1
+
+    async def _close_context(self, slot: _Slot) -> None:
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except PlaywrightError as e:
+                logging.warning(f"Failed to close context on pool slot {slot.index}: {e}")
+            slot.context = None
+            slot.uses = 0
+
+    async def _close_slot(self, slot: _Slot) -> None:
+        await self._close_context(slot)
+        if slot.browser is not None:
+            try:
+                await slot.browser.close()
+            except PlaywrightError as e:
+                logging.warning(f"Failed to close browser on pool slot {slot.index}: {e}")
+            slot.browser = None
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, Optional
+from metrics import get_metrics
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "shorts")
+
+DEFAULT_TTLS = {
+    'heatmap': 7 * 24 * 3600,
+    'transcript': 30 * 24 * 3600,
+    'info': 24 * 3600,
+    # Videos without most-replayed data are re-checked sooner, since the heatmap appears once a video has enough views
+    'heatmap_empty': 6 * 3600,
+    # Same for videos without a matching transcript, which may get captions later
+    'transcript_empty': 6 * 3600,
+}
+
+_MISSING = object()
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode when an artifact is not cached."""
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['hit_rate'] = self.hit_rate
+        return data
+
+
+class DiskCache:
+    """On-disk JSON cache keyed by video ID and artifact type.
+
+    Entries are stored under a hash of their key and written atomically via a
+    temp file and `os.replace`, so concurrent workers never see partial files.
+    Reads refresh the file mtime, which drives least-recently-used eviction once
+    the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = 2 * 1024 ** 3, ttls: Optional[Dict[str, float]] = None, offline: bool = False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.offline = offline
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._size = self._scan_size()
+
+    def _path(self, video_id: str, artifact: str) -> str:
+        digest = hashlib.sha256(f"{artifact}:{video_id}".encode('utf-8')).hexdigest()
+        return os.path.join(self.root, artifact, digest[:2], f"{digest}.json")
+
+    def _entries(self):
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.json'):
+                    yield os.path.join(directory, filename)
+
+    def _scan_size(self) -> int:
+        total = 0
+        for path in self._entries():
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total
+
+    def get(self, video_id: str, artifact: str, default: Any = None) -> Any:
+        path = self._path(video_id, artifact)
+        try:
+            with open(path, 'r', encoding='utf-8') as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            self.stats.misses += 1
+            get_metrics().increment('cache_lookups', artifact=artifact, result='miss')
+            return default
+
+        ttl = entry.get('ttl')
+        if ttl is not None and time.time() - entry['created'] > ttl:
+            self.stats.expired += 1
+            self.stats.misses += 1
+            get_metrics().increment('cache_lookups', artifact=artifact, result='expired')
+            return default
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.stats.hits += 1
+        get_metrics().increment('cache_lookups', artifact=artifact, result='hit')
+        return entry['value']
+
+    def set(self, video_id: str, artifact: str, value: Any, ttl: Optional[float] = _MISSING) -> None:
+        if ttl is _MISSING:
+            ttl = self.ttls.get(artifact)
+        path = self._path(video_id, artifact)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps({'video_id': video_id, 'artifact': artifact, 'created': time.time(), 'ttl': ttl, 'value': value})
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as temp_file:
+                temp_file.write(payload)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self.stats.writes += 1
+        with self._lock:
+            self._size += len(payload)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def get_or_fetch(self, video_id: str, artifact: str, fetch: Callable[[], Any], ttl: Optional[float] = _MISSING) -> Any:
+        """Returns the cached artifact or calls `fetch` and stores non-None results.
+
+        In offline mode a miss raises `CacheMiss` instead of fetching.
+        """
+        value = self.get(video_id, artifact, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.offline:
+            raise CacheMiss(f"{artifact} for video ID {video_id} is not cached")
+        value = fetch()
+        if value is not None:
+            self.set(video_id, artifact, value, ttl)
+        return value
+
+    def _evict(self) -> None:
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        # Evict down to 90% of the quota so every write near the limit does not trigger a rescan
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.stats.evictions += 1
+            get_metrics().increment('cache_evictions')
+        logging.info(f"Cache eviction finished, {self._size} bytes in use")
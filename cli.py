@@ -0,0 +1,110 @@
+import argparse
+import json
+import logging
+import sys
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+from browser_pool import install_browsers
+from cache import DiskCache, DEFAULT_CACHE_DIR
+from clip_planner import PlannerSettings
+from manifest import JobManifest, job_id_for
+from metrics import get_metrics, log_to_file
+from pipeline import DEFAULT_VIDEO_URL_TEMPLATE, StageLimits, run_batch
+from transcript import build_preferences
+from sources import stream_video_ids
+from workspace import DEFAULT_QUOTA_BYTES, DEFAULT_WORKSPACE_DIR, Workspace
+from video_processing import CUT_MODES, DEFAULT_DOWNLOAD_HEIGHT, DOWNLOAD_MODES, SECTION_PADDING
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Generate short clips from YouTube videos without the Streamlit UI.")
+    parser.add_argument('--video', action='append', default=[], help="Video URL or ID (repeatable)")
+    parser.add_argument('--playlist', action='append', default=[], help="Playlist URL (repeatable)")
+    parser.add_argument('--channel', action='append', default=[], help="Channel URL (repeatable)")
+    parser.add_argument('--output-dir', help="Clip directory (default: the job's workspace clip directory)")
+    parser.add_argument('--workspace-dir', default=DEFAULT_WORKSPACE_DIR, help="Root of the per-job scratch directories")
+    parser.add_argument('--disk-quota-gb', type=float, default=DEFAULT_QUOTA_BYTES / 1024 ** 3,
+                        help="Downloads pause while the workspace is close to this size")
+    parser.add_argument('--keep-sources', action='store_true', help="Keep downloaded source videos after cutting")
+    parser.add_argument('--language', default="tr", help="Preferred subtitle language code")
+    parser.add_argument('--clip-mode', choices=CUT_MODES, default="fast")
+    parser.add_argument('--single-pass', action='store_true', help="Cut all clips of a video with one ffmpeg process")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--offline', action='store_true', help="Only use cached heatmaps, transcripts and metadata")
+    parser.add_argument('--manifest', help="SQLite manifest path for resumable runs")
+    parser.add_argument('--top-k', type=int, default=PlannerSettings.top_k, help="Maximum clips per video")
+    parser.add_argument('--min-length', type=float, default=PlannerSettings.min_length, help="Shortest clip in seconds")
+    parser.add_argument('--max-length', type=float, default=PlannerSettings.max_length, help="Longest clip in seconds")
+    parser.add_argument('--download-mode', choices=DOWNLOAD_MODES, default="full",
+                        help="'sections' downloads only the planned clip windows after heatmap analysis")
+    parser.add_argument('--download-height', type=int, default=DEFAULT_DOWNLOAD_HEIGHT, help="Maximum video height to download")
+    parser.add_argument('--section-padding', type=float, default=SECTION_PADDING, help="Seconds downloaded around each planned clip")
+    parser.add_argument('--video-url-template', default=DEFAULT_VIDEO_URL_TEMPLATE, help="Download URL with a {video_id} placeholder")
+    parser.add_argument('--raw-rises', action='store_true', help="Cut every heatmap rise instead of the planned top clips")
+    parser.add_argument('--download-limit', type=int, default=StageLimits.download)
+    parser.add_argument('--heatmap-limit', type=int, default=StageLimits.heatmap)
+    parser.add_argument('--transcript-limit', type=int, default=StageLimits.transcript)
+    parser.add_argument('--clip-limit', type=int)
+    parser.add_argument('--install-browsers', action='store_true', help="Install Playwright browsers before running")
+    parser.add_argument('--metrics-log', help="Write per-stage spans and counters as JSON lines to this file")
+    parser.add_argument('--metrics-json', help="Write the batch timing summary with percentiles to this JSON file")
+    parser.add_argument('--metrics-prom', help="Write metrics in Prometheus text format to this file")
+    return parser
+
+
+def run(args: argparse.Namespace, stream=sys.stdout) -> List[Dict[str, Any]]:
+    """Runs the pipeline for the parsed arguments, writing one JSON line per finished video."""
+    if args.install_browsers:
+        install_browsers()
+    if args.metrics_log:
+        log_to_file(args.metrics_log)
+
+    video_ids = stream_video_ids(args.video, args.playlist, args.channel)
+    preferences = build_preferences(args.language)
+    limits = StageLimits(download=args.download_limit, heatmap=args.heatmap_limit, transcript=args.transcript_limit)
+    if args.clip_limit:
+        limits.clip = args.clip_limit
+    cache = None if args.no_cache else DiskCache(args.cache_dir, offline=args.offline)
+    planner = None if args.raw_rises else PlannerSettings(min_length=args.min_length, max_length=args.max_length, top_k=args.top_k)
+    job_id = job_id_for(args.video + args.playlist + args.channel, preferences=preferences, clip_mode=args.clip_mode,
+                        single_pass=args.single_pass, output_dir=args.output_dir,
+                        planner=asdict(planner) if planner else None, download_mode=args.download_mode)
+    manifest = JobManifest(args.manifest, job_id) if args.manifest else None
+    workspace = Workspace(args.workspace_dir, job_id, quota_bytes=int(args.disk_quota_gb * 1024 ** 3), keep_sources=args.keep_sources)
+
+    def emit(result: Dict[str, Any]) -> None:
+        stream.write(json.dumps(result, default=str) + "\n")
+        stream.flush()
+
+    try:
+        return run_batch(video_ids, on_result=emit, output_dir=args.output_dir, limits=limits, cache=cache,
+                         transcript_preferences=preferences, clip_mode=args.clip_mode, single_pass=args.single_pass,
+                         manifest=manifest, planner=planner, download_mode=args.download_mode, download_height=args.download_height,
+                         section_padding=args.section_padding, video_url_template=args.video_url_template, workspace=workspace)
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if cache is not None:
+            logging.info(f"Cache stats: {cache.stats.to_dict()}")
+        # With clips written elsewhere the job directory only holds scratch files
+        if args.output_dir and not args.keep_sources:
+            workspace.remove()
+        if args.metrics_json:
+            get_metrics().export_json(args.metrics_json)
+        if args.metrics_prom:
+            get_metrics().write_prometheus(args.metrics_prom)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if not (args.video or args.playlist or args.channel):
+        build_parser().error("at least one --video, --playlist or --channel is required")
+    # Logs go to stderr so stdout carries only JSON lines
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    results = run(args)
+    return 0 if all(result['status'] == 'done' for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
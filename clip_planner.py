@@ -0,0 +1,104 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List
+import numpy as np
+from heatmap_array import HeatmapArray
+
+
+@dataclass(frozen=True)
+class PlannerSettings:
+    """Controls how heatmap rises are turned into Shorts-sized clip windows."""
+    smoothing_seconds: float = 5.0
+    threshold: float = 1.35
+    merge_gap: float = 10.0
+    min_length: float = 15.0
+    max_length: float = 60.0
+    top_k: int = 3
+
+    def __post_init__(self):
+        if self.min_length > self.max_length:
+            raise ValueError("min_length must not exceed max_length")
+
+
+def smooth(heatmap: HeatmapArray, window_seconds: float) -> HeatmapArray:
+    """Moving average over roughly `window_seconds`, normalized at the edges so the ends are not pulled down."""
+    if len(heatmap) < 2 or window_seconds <= 0:
+        return heatmap
+    spacing = float(np.median(np.diff(heatmap.times)))
+    # np.convolve's 'same' mode returns max(len, width) samples, so the window never exceeds the heatmap
+    width = min(int(round(window_seconds / spacing)) if spacing > 0 else 1, len(heatmap))
+    if width <= 1:
+        return heatmap
+    kernel = np.ones(width)
+    totals = np.convolve(heatmap.attention, kernel, mode='same')
+    counts = np.convolve(np.ones(len(heatmap)), kernel, mode='same')
+    return HeatmapArray(heatmap.times, totals / counts)
+
+
+def merge_windows(starts: np.ndarray, ends: np.ndarray, gap: float) -> List[List[float]]:
+    """Joins windows separated by at most `gap` seconds; inputs must be sorted by start."""
+    merged: List[List[float]] = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if merged and start - merged[-1][1] <= gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class _AttentionIntegral:
+    """Area of the attention curve above its mean, evaluated between arbitrary times by interpolation."""
+
+    def __init__(self, heatmap: HeatmapArray):
+        self.times = heatmap.times
+        excess = np.clip(heatmap.attention - heatmap.attention.mean(), 0, None)
+        self.cumulative = np.concatenate(([0.0], np.cumsum(np.diff(self.times) * (excess[:-1] + excess[1:]) / 2)))
+
+    def __call__(self, starts, ends):
+        return np.interp(ends, self.times, self.cumulative) - np.interp(starts, self.times, self.cumulative)
+
+
+def _fit_window(start: float, end: float, duration: float, settings: PlannerSettings, integral: _AttentionIntegral) -> List[float]:
+    length = end - start
+    if length > settings.max_length:
+        # Slide a max_length window across the run and keep the placement with the most attention
+        candidates = np.concatenate(([start], integral.times[(integral.times > start) & (integral.times < end - settings.max_length)], [end - settings.max_length]))
+        best = float(candidates[np.argmax(integral(candidates, candidates + settings.max_length))])
+        return [best, best + settings.max_length]
+    if length < settings.min_length:
+        center = (start + end) / 2
+        start, end = center - settings.min_length / 2, center + settings.min_length / 2
+        if start < 0:
+            start, end = 0.0, settings.min_length
+        if duration and end > duration:
+            start, end = max(0.0, duration - settings.min_length), float(duration)
+    return [start, end]
+
+
+def plan_clips(heatmap: HeatmapArray, duration: float, settings: PlannerSettings = PlannerSettings()) -> List[Dict[str, Any]]:
+    """Returns up to `top_k` non-overlapping clip windows, ordered by start time.
+
+    The curve is smoothed before thresholding, rises closer than `merge_gap`
+    are joined, each window is padded or trimmed to the Shorts length limits
+    and candidates are ranked by attention above the video's average.
+    """
+    if len(heatmap) < 2:
+        return []
+    smoothed = smooth(heatmap, settings.smoothing_seconds)
+    starts, ends = smoothed.runs(smoothed.attention > smoothed.attention.mean() + settings.threshold)
+    integral = _AttentionIntegral(smoothed)
+    windows = [_fit_window(start, end, duration, settings, integral) for start, end in merge_windows(starts, ends, settings.merge_gap)]
+    if not windows:
+        return []
+    bounds = np.array(windows)
+    scores = integral(bounds[:, 0], bounds[:, 1])
+
+    selected: List[Dict[str, Any]] = []
+    for index in np.argsort(-scores, kind='stable').tolist():
+        start, end = windows[index]
+        # Padding can push neighbouring windows into each other, so keep only the better one
+        if any(start < chosen['end'] and chosen['start'] < end for chosen in selected):
+            continue
+        selected.append({'start': start, 'end': end, 'score': float(scores[index])})
+        if len(selected) >= settings.top_k:
+            break
+    return sorted(selected, key=lambda window: window['start'])
@@ -1,74 +1,169 @@
+import asyncio
 import logging
-import re
-from typing import List, Dict
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Optional
 import xml.etree.ElementTree as ET
 from lxml import html, etree
-import random
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
-
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Edge/91.0.864.59 Safari/537.36"
-]
-
-RESOLUTIONS = [
-    {"width": 1024, "height": 768},
-    {"width": 1280, "height": 720},
-    {"width": 1366, "height": 768},
-    {"width": 1440, "height": 900},
-    {"width": 1600, "height": 900}
-]
-
-BROWSERS = ["chromium"]
-
-async def extract_video_data(video_id):
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from browser_pool import BrowserPool
+from heatmap_array import HeatmapArray
+from metrics import get_metrics
+from watch_page import fetch_most_replayed
+
+VIDEO_DURATION_SCRIPT = """() => {
+    const response = window.ytInitialPlayerResponse;
+    if (response && response.videoDetails) {
+        return Number(response.videoDetails.lengthSeconds);
+    }
+    const video = document.querySelector('video');
+    return video && isFinite(video.duration) ? video.duration : null;
+}"""
+
+HEATMAP_READY_SCRIPT = """() => document.querySelector('div.ytp-heat-map-container svg path') !== null"""
+
+# Resolves with whichever is present first: the heatmap paths, or the player response plus page data
+FIRST_READY_SCRIPT = """() => {
+    if (document.querySelector('div.ytp-heat-map-container svg path')) {
+        return 'heatmap';
+    }
+    const response = window.ytInitialPlayerResponse;
+    return response && response.videoDetails && window.ytInitialData ? 'player' : null;
+}"""
+
+# The most-replayed markers ship in ytInitialData, so without them no heatmap will be drawn
+HAS_HEATMAP_DATA_SCRIPT = """() => {
+    const data = JSON.stringify(window.ytInitialData || {});
+    return data.includes('MARKER_TYPE_HEATMAP') || data.includes('heatMarkerRenderer');
+}"""
+
+READINESS_MODES = ("event", "legacy")
+
+
+class PhaseTimer:
+    """Records wall time spent in each named phase of a page load."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - started, 3)
+
+
+async def extract_video_data(video_id, pool: Optional[BrowserPool] = None, readiness: str = "event", heatmap_timeout: int = 15000, prefer_http: bool = True):
+    """Loads the watch page and extracts duration, heatmap points and analysis.
+
+    With `prefer_http` the most-replayed markers are first read from the plain
+    watch-page JSON. The browser is only used when the page could not be
+    fetched or decoded; a decoded page without markers means the video has no
+    heatmap, so the browser would not render one either.
+
+    With `readiness="event"` the page is considered ready as soon as the heatmap
+    SVG paths are attached or the player response and page data show the
+    video has no heatmap, instead of sleeping and waiting for network idle.
+    `readiness="legacy"` keeps the original fixed waits.
+    """
+    if readiness not in READINESS_MODES:
+        raise ValueError(f"Unsupported readiness mode: {readiness}")
     logging.info(f"Extracting video data for video ID: {video_id}")
-    async with async_playwright() as p:
-        browser_type = random.choice(BROWSERS)
-        browser = await getattr(p, browser_type).launch(
-            headless=True,
-            args=["--disable-gpu", "--no-sandbox", "--disable-dev-shm-usage", "--disable-extensions", "--disable-plugins"]
-        )
-
-        context = await browser.new_context(
-            user_agent=random.choice(USER_AGENTS),
-            viewport=random.choice(RESOLUTIONS),
-            locale="en-US",
-            ignore_https_errors=True,
-            java_script_enabled=True,
-            bypass_csp=True
-        )
-
-        await context.route("**/*", lambda route: route.abort() if route.request.resource_type in ["video", "audio", "font"] else route.continue_())
-
-        page = await context.new_page()
+    metrics = get_metrics()
+    if prefer_http:
+        started = time.perf_counter()
+        with metrics.span('heatmap.http_fetch', video_id):
+            most_replayed = await asyncio.to_thread(fetch_most_replayed, video_id)
+        if most_replayed is not None:
+            heatmap_points, video_duration = most_replayed
+            if not heatmap_points:
+                logging.info(f"No most-replayed data for video ID {video_id}")
+            return {
+                'video_id': video_id,
+                'duration': video_duration,
+                'heatmap_points': heatmap_points,
+                'analysis': analyze_heatmap_data(heatmap_points),
+                'timings': {'http_fetch': round(time.perf_counter() - started, 3)},
+                'source': 'http'
+            }
+        logging.info(f"Watch page for video ID {video_id} could not be read, falling back to browser")
+        metrics.increment('fallbacks', stage='heatmap', to='browser')
 
+    if pool is None:
+        async with BrowserPool(size=1) as own_pool:
+            return await extract_video_data(video_id, own_pool, readiness, heatmap_timeout, prefer_http=False)
+
+    timer = PhaseTimer()
+    acquire_started = time.perf_counter()
+    async with pool.page() as page:
+        timer.timings['acquire_page'] = round(time.perf_counter() - acquire_started, 3)
         video_url = f"https://www.youtube.com/watch?v={video_id}"
-        await page.goto(video_url, wait_until="domcontentloaded", timeout=60000)
+        with timer.phase('navigation'):
+            await page.goto(video_url, wait_until="domcontentloaded", timeout=60000)
+            if "m.youtube.com" in page.url:
+                wait_until = "networkidle" if readiness == "legacy" else "domcontentloaded"
+                await page.goto(video_url.replace("m.youtube.com", "www.youtube.com"), wait_until=wait_until)
 
-        if "m.youtube.com" in page.url:
-            await page.goto(video_url.replace("m.youtube.com", "www.youtube.com"), wait_until="networkidle")
+        if readiness == "legacy":
+            with timer.phase('legacy_waits'):
+                await _legacy_page_waits(page)
+        else:
+            with timer.phase('player_ready'):
+                try:
+                    first_ready = await (await page.wait_for_function(FIRST_READY_SCRIPT, timeout=heatmap_timeout)).json_value()
+                except PlaywrightTimeoutError:
+                    logging.warning(f"Player response not found for video ID {video_id}")
+                    first_ready = None
+            # Only wait for the paths to render when the page data says the video has a heatmap
+            if first_ready == 'player' and await page.evaluate(HAS_HEATMAP_DATA_SCRIPT):
+                with timer.phase('heatmap_ready'):
+                    try:
+                        await page.wait_for_function(HEATMAP_READY_SCRIPT, timeout=heatmap_timeout)
+                    except PlaywrightTimeoutError:
+                        logging.warning(f"Heatmap paths did not appear for video ID {video_id}")
+            elif first_ready == 'player':
+                logging.info(f"No most-replayed data in page for video ID {video_id}, not waiting for heatmap paths")
 
-        expand_selector = 'tp-yt-paper-button#expand'
+        with timer.phase('extract'):
+            duration = await page.evaluate(VIDEO_DURATION_SCRIPT)
+            heatmap_svg = await extract_heatmap_svgs(page, wait_for_ready=readiness == "legacy")
 
-        try:
-            await page.wait_for_selector(expand_selector, timeout=20000)
-            expand_button = await page.query_selector(expand_selector)
-            if expand_button:
-                await expand_button.click()
-        except PlaywrightTimeoutError:
-            logging.warning("Expand button not found.")
+    video_duration = float(duration) if duration else 0.0
+    if video_duration and heatmap_svg.lstrip().startswith('<svg'):
+        with timer.phase('svg_parse'):
+            heatmap_points = parse_svg_heatmap(heatmap_svg, video_duration)
+    else:
+        logging.warning(f"No usable heatmap for video ID {video_id}: {heatmap_svg[:200]}")
+        heatmap_points = []
+    logging.info(f"Page timings for video ID {video_id}: {timer.timings}")
+    for phase, seconds in timer.timings.items():
+        metrics.record(f"heatmap.{phase}", seconds, video_id)
+    return {
+        'video_id': video_id,
+        'duration': video_duration,
+        'heatmap_points': heatmap_points,
+        'analysis': analyze_heatmap_data(heatmap_points),
+        'timings': timer.timings,
+        'source': 'browser'
+    }
 
-        await page.evaluate("window.scrollTo(0, document.documentElement.scrollHeight)")
-        await page.wait_for_timeout(8000)
+async def _legacy_page_waits(page):
+    expand_selector = 'tp-yt-paper-button#expand'
 
-        content = await page.content()
-        tree = html.fromstring(content)
+    try:
+        await page.wait_for_selector(expand_selector, timeout=20000)
+        expand_button = await page.query_selector(expand_selector)
+        if expand_button:
+            await expand_button.click()
+    except PlaywrightTimeoutError:
+        logging.warning("Expand button not found.")
+
+    await page.evaluate("window.scrollTo(0, document.documentElement.scrollHeight)")
+    await page.wait_for_timeout(8000)
 
-async def extract_heatmap_svgs(page):
+async def _wait_for_heatmap_container(page):
     try:
         await page.wait_for_load_state('networkidle')
         logging.info("Network idle state reached")
@@ -82,6 +177,14 @@ async def extract_heatmap_svgs(page):
         logging.error(f"Timeout waiting for heatmap container: {e}")
         return f"Timeout waiting for heatmap container: {e}"
 
+    return None
+
+async def extract_heatmap_svgs(page, wait_for_ready: bool = True):
+    if wait_for_ready:
+        heatmap_error = await _wait_for_heatmap_container(page)
+        if heatmap_error:
+            return heatmap_error
+
     heatmap_container = await page.query_selector('div.ytp-heat-map-container')
     if heatmap_container:
         heatmap_container_html = await heatmap_container.inner_html()
@@ -135,60 +238,28 @@ def get_pixel_value(value):
         raise ValueError(f"Unsupported width/height format: {value}")
 
 def parse_svg_heatmap(heatmap_svg, video_duration_seconds, svg_width=1000, svg_height=1000):
+    return parse_svg_heatmap_array(heatmap_svg, video_duration_seconds, svg_width, svg_height).to_points()
+
+def parse_svg_heatmap_array(heatmap_svg, video_duration_seconds, svg_width=1000, svg_height=1000) -> HeatmapArray:
     if not heatmap_svg or heatmap_svg.strip() == "":
         logging.error("SVG heatmap content is empty or None")
-        return []
+        return HeatmapArray.empty()
     try:
         tree = ET.ElementTree(ET.fromstring(heatmap_svg))
         root = tree.getroot()
     except ET.ParseError as e:
         logging.error(f"Failed to parse SVG heatmap: {e}")
         logging.error(f"SVG content: {heatmap_svg}")
-        return []
-    heatmap_points = []
-    for g in root.findall('.//{http://www.w3.org/2000/svg}g'):
-        for defs in g.findall('.//{http://www.w3.org/2000/svg}defs'):
-            for path in defs.findall('.//{http://www.w3.org/2000/svg}path'):
-                d_attr = path.attrib.get('d', '')
-                coordinates = re.findall(r'[MC]([^MC]+)', d_attr)
-                for segment in coordinates:
-                    points = segment.strip().replace(',', ' ').split()
-                    for i in range(0, len(points), 2):
-                        x = float(points[i])
-                        y = float(points[i + 1])
-                        duration_seconds = (x / svg_width) * video_duration_seconds
-                        attention = 100 - (y / svg_height) * 100
-                        heatmap_points.append({'Attention': attention, 'duration': duration_seconds})
-    return heatmap_points
+        return HeatmapArray.empty()
+    d_attrs = [
+        path.attrib.get('d', '')
+        for g in root.findall('.//{http://www.w3.org/2000/svg}g')
+        for defs in g.findall('.//{http://www.w3.org/2000/svg}defs')
+        for path in defs.findall('.//{http://www.w3.org/2000/svg}path')
+    ]
+    return HeatmapArray.from_path_data(d_attrs, video_duration_seconds, svg_width, svg_height)
 
 def analyze_heatmap_data(heatmap_points: List[Dict[str, float]], threshold: float = 1.35) -> Dict[str, any]:
     if not heatmap_points or not all(isinstance(point, dict) and 'Attention' in point and 'duration' in point for point in heatmap_points):
         return {}
-    total_attention = sum(point['Attention'] for point in heatmap_points)
-    average_attention = total_attention / len(heatmap_points)
-    significant_rises = []
-    significant_falls = []
-    rise_start = None
-    fall_start = None
-    for i, point in enumerate(heatmap_points):
-        attention = point['Attention']
-        duration = point['duration']
-        if attention > average_attention + threshold:
-            if rise_start is None:
-                rise_start = duration
-            if i == len(heatmap_points) - 1 or heatmap_points[i + 1]['Attention'] <= average_attention + threshold:
-                significant_rises.append({'start': rise_start, 'end': duration})
-                rise_start = None
-        if attention < average_attention - threshold:
-            if fall_start is None:
-                fall_start = duration
-            if i == len(heatmap_points) - 1 or heatmap_points[i + 1]['Attention'] >= average_attention - threshold:
-                significant_falls.append({'start': fall_start, 'end': duration})
-                fall_start = None
-    return {
-        'average_attention': average_attention,
-        'significant_rises': significant_rises,
-        'significant_falls': significant_falls,
-        'total_rises': len(significant_rises),
-        'total_falls': len(significant_falls)
-    }
+    return HeatmapArray.from_points(heatmap_points).analyze(threshold)
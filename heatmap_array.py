@@ -0,0 +1,67 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Tuple
+import numpy as np
+
+PATH_SEGMENT_PATTERN = re.compile(r'[MC]([^MC]+)')
+
+
+@dataclass(frozen=True)
+class HeatmapArray:
+    """Heatmap stored as two parallel float arrays instead of a list of point dicts."""
+    times: np.ndarray
+    attention: np.ndarray
+
+    def __post_init__(self):
+        if self.times.shape != self.attention.shape:
+            raise ValueError("times and attention must have the same shape")
+
+    def __len__(self) -> int:
+        return int(self.times.size)
+
+    @classmethod
+    def empty(cls) -> "HeatmapArray":
+        return cls(np.empty(0), np.empty(0))
+
+    @classmethod
+    def from_points(cls, heatmap_points: List[Dict[str, float]]) -> "HeatmapArray":
+        times = np.fromiter((point['duration'] for point in heatmap_points), dtype=np.float64, count=len(heatmap_points))
+        attention = np.fromiter((point['Attention'] for point in heatmap_points), dtype=np.float64, count=len(heatmap_points))
+        return cls(times, attention)
+
+    @classmethod
+    def from_path_data(cls, d_attrs: Iterable[str], video_duration_seconds: float, svg_width: float = 1000, svg_height: float = 1000) -> "HeatmapArray":
+        """Parses the `M`/`C` coordinates of SVG path `d` attributes in one pass."""
+        numbers = ' '.join(segment for d_attr in d_attrs for segment in PATH_SEGMENT_PATTERN.findall(d_attr))
+        if not numbers.strip():
+            return cls.empty()
+        coordinates = np.array(numbers.replace(',', ' ').split(), dtype=np.float64).reshape(-1, 2)
+        times = coordinates[:, 0] / svg_width * video_duration_seconds
+        attention = 100 - coordinates[:, 1] / svg_height * 100
+        return cls(times, attention)
+
+    def to_points(self) -> List[Dict[str, float]]:
+        return [{'Attention': attention, 'duration': duration} for attention, duration in zip(self.attention.tolist(), self.times.tolist())]
+
+    def runs(self, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns start and end times of every contiguous run where `mask` is true."""
+        edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        return self.times[starts], self.times[ends]
+
+    def analyze(self, threshold: float = 1.35) -> Dict[str, Any]:
+        if not len(self):
+            return {}
+        average_attention = float(self.attention.mean())
+        rise_starts, rise_ends = self.runs(self.attention > average_attention + threshold)
+        fall_starts, fall_ends = self.runs(self.attention < average_attention - threshold)
+        significant_rises = [{'start': start, 'end': end} for start, end in zip(rise_starts.tolist(), rise_ends.tolist())]
+        significant_falls = [{'start': start, 'end': end} for start, end in zip(fall_starts.tolist(), fall_ends.tolist())]
+        return {
+            'average_attention': average_attention,
+            'significant_rises': significant_rises,
+            'significant_falls': significant_falls,
+            'total_rises': len(significant_rises),
+            'total_falls': len(significant_falls)
+        }
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+from utils import save_json
+
+STAGES = ("download", "heatmap", "transcript", "clip")
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with jitter: base_delay * multiplier ** (attempt - 1), capped at max_delay."""
+    max_attempts: int = 3
+    base_delay: float = 2.0
+    multiplier: float = 2.0
+    max_delay: float = 60.0
+    jitter: float = 0.1
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+def job_id_for(inputs: Iterable[str], **options: Any) -> str:
+    """Derives a stable job ID from the input URLs or video IDs and any output-affecting options."""
+    payload = json.dumps({'inputs': list(inputs), 'options': options}, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class JobManifest:
+    """SQLite record of each video's stage status, artifacts and errors for one batch job.
+
+    A restarted job with the same `job_id` skips stages already marked done and
+    retries the ones that failed or never finished.
+    """
+
+    def __init__(self, path: str = "jobs.sqlite3", job_id: str = "default"):
+        self.path = path
+        self.job_id = job_id
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS stages (
+                job_id TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                artifacts TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (job_id, video_id, stage)
+            )
+        """)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _row(self, video_id: str, stage: str) -> Optional[sqlite3.Row]:
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT status, attempts, artifacts, error FROM stages WHERE job_id = ? AND video_id = ? AND stage = ?",
+                (self.job_id, video_id, stage)
+            )
+            return cursor.fetchone()
+
+    def status(self, video_id: str, stage: str) -> str:
+        row = self._row(video_id, stage)
+        return row[0] if row else PENDING
+
+    def artifacts(self, video_id: str, stage: str) -> Any:
+        row = self._row(video_id, stage)
+        return json.loads(row[2]) if row and row[2] else None
+
+    def is_done(self, video_id: str, stage: str) -> bool:
+        return self.status(video_id, stage) == DONE
+
+    def _upsert(self, video_id: str, stage: str, status: str, artifacts: Any = None, error: Optional[str] = None, attempt: bool = False) -> None:
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        with self._lock:
+            self._connection.execute("""
+                INSERT INTO stages (job_id, video_id, stage, status, attempts, artifacts, error, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (job_id, video_id, stage) DO UPDATE SET
+                    status = excluded.status,
+                    attempts = stages.attempts + ?,
+                    artifacts = COALESCE(excluded.artifacts, stages.artifacts),
+                    error = excluded.error,
+                    updated_at = excluded.updated_at
+            """, (self.job_id, video_id, stage, status, int(attempt), None if artifacts is None else json.dumps(artifacts),
+                  error, time.time(), int(attempt)))
+
+    def mark_running(self, video_id: str, stage: str) -> None:
+        self._upsert(video_id, stage, RUNNING, attempt=True)
+
+    def mark_done(self, video_id: str, stage: str, artifacts: Any = None) -> None:
+        self._upsert(video_id, stage, DONE, artifacts)
+
+    def mark_failed(self, video_id: str, stage: str, error: str) -> None:
+        self._upsert(video_id, stage, FAILED, error=error)
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Returns {video_id: {stage: {status, attempts, error}}} for this job."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT video_id, stage, status, attempts, error FROM stages WHERE job_id = ? ORDER BY video_id, stage",
+                (self.job_id,)
+            ).fetchall()
+        summary: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for video_id, stage, status, attempts, error in rows:
+            summary.setdefault(video_id, {})[stage] = {'status': status, 'attempts': attempts, 'error': error}
+        return summary
+
+    def failed_videos(self) -> List[str]:
+        return [video_id for video_id, stages in self.summary().items() if any(stage['status'] == FAILED for stage in stages.values())]
+
+    def export_json(self, file_path: str) -> None:
+        save_json({'job_id': self.job_id, 'videos': self.summary()}, file_path)
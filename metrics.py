@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Structured records go to their own logger so they can be routed to a JSON sink
+metrics_logger = logging.getLogger("shorts.metrics")
+
+
+def percentile(sorted_values: List[float], quantile: float) -> float:
+    """Linear-interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * quantile
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+class Metrics:
+    """Collects stage timings, counters and subprocess resource usage for a batch run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+        self.subprocess_cpu: Dict[str, float] = defaultdict(float)
+        self.subprocess_max_rss: Dict[str, int] = defaultdict(int)
+
+    def record(self, stage: str, seconds: float, video_id: Optional[str] = None, **tags: Any) -> None:
+        with self._lock:
+            self.durations[stage].append(seconds)
+        metrics_logger.info(json.dumps({'type': 'span', 'stage': stage, 'video_id': video_id, 'seconds': round(seconds, 6), **tags}, default=str))
+
+    @contextmanager
+    def span(self, stage: str, video_id: Optional[str] = None, **tags: Any):
+        """Times the enclosed block; failures are recorded with `status="error"`."""
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.record(stage, time.perf_counter() - started, video_id, status=status, **tags)
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        with self._lock:
+            self.counters[(name, _label_key(labels))] += value
+        metrics_logger.info(json.dumps({'type': 'counter', 'name': name, 'value': value, **labels}, default=str))
+
+    def record_subprocess(self, stage: str, cpu_seconds: float, max_rss_bytes: int, video_id: Optional[str] = None) -> None:
+        with self._lock:
+            self.subprocess_cpu[stage] += cpu_seconds
+            self.subprocess_max_rss[stage] = max(self.subprocess_max_rss[stage], max_rss_bytes)
+        metrics_logger.info(json.dumps({'type': 'subprocess', 'stage': stage, 'video_id': video_id,
+                                        'cpu_seconds': round(cpu_seconds, 6), 'max_rss_bytes': max_rss_bytes}))
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-stage count, total and percentiles, plus counters and subprocess usage."""
+        with self._lock:
+            durations = {stage: sorted(values) for stage, values in self.durations.items()}
+            counters = dict(self.counters)
+            subprocess_cpu = dict(self.subprocess_cpu)
+            subprocess_max_rss = dict(self.subprocess_max_rss)
+        stages = {}
+        for stage, values in durations.items():
+            stages[stage] = {
+                'count': len(values),
+                'total_seconds': sum(values),
+                'max_seconds': values[-1],
+                **{f"p{int(quantile * 100)}_seconds": percentile(values, quantile) for quantile in QUANTILES}
+            }
+        return {
+            'stages': stages,
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in counters.items()],
+            'subprocesses': {stage: {'cpu_seconds': subprocess_cpu[stage], 'max_rss_bytes': subprocess_max_rss.get(stage, 0)}
+                             for stage in subprocess_cpu},
+        }
+
+    def export_json(self, file_path: str) -> None:
+        # Not utils.save_json: utils imports transcript, which imports this module
+        with open(file_path, 'w', encoding='utf-8') as json_file:
+            json.dump(self.summary(), json_file, indent=4)
+
+    def to_prometheus(self, prefix: str = "shorts") -> str:
+        summary = self.summary()
+        lines = [f"# TYPE {prefix}_stage_duration_seconds summary"]
+        for stage, stats in summary['stages'].items():
+            for quantile in QUANTILES:
+                lines.append(f'{prefix}_stage_duration_seconds{{stage="{stage}",quantile="{quantile}"}} {stats[f"p{int(quantile * 100)}_seconds"]}')
+            lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{stage}"}} {stats["total_seconds"]}')
+            lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        counter_names = sorted({counter['name'] for counter in summary['counters']})
+        for name in counter_names:
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for counter in summary['counters']:
+                if counter['name'] == name:
+                    labels = ','.join(f'{key}="{value}"' for key, value in counter['labels'].items())
+                    lines.append(f"{prefix}_{name}_total{{{labels}}} {counter['value']}")
+        if summary['subprocesses']:
+            lines.append(f"# TYPE {prefix}_subprocess_cpu_seconds_total counter")
+            for stage, usage in summary['subprocesses'].items():
+                lines.append(f'{prefix}_subprocess_cpu_seconds_total{{stage="{stage}"}} {usage["cpu_seconds"]}')
+            lines.append(f"# TYPE {prefix}_subprocess_max_rss_bytes gauge")
+            for stage, usage in summary['subprocesses'].items():
+                lines.append(f'{prefix}_subprocess_max_rss_bytes{{stage="{stage}"}} {usage["max_rss_bytes"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, file_path: str) -> None:
+        """Writes the text exposition format atomically, suitable for node_exporter's textfile collector."""
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as prometheus_file:
+            prometheus_file.write(self.to_prometheus())
+        os.replace(temp_path, file_path)
+
+
+def log_to_file(file_path: str) -> logging.Handler:
+    """Sends the structured metric records to a JSON-lines file instead of the main log."""
+    handler = logging.FileHandler(file_path, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    metrics_logger.addHandler(handler)
+    metrics_logger.setLevel(logging.INFO)
+    metrics_logger.propagate = False
+    return handler
+
+
+def run_measured(command, stage: str, video_id: Optional[str] = None, metrics: Optional["Metrics"] = None,
+                 on_start: Optional[Callable[[subprocess.Popen], None]] = None, **kwargs) -> subprocess.CompletedProcess:
+    """Runs a subprocess like `subprocess.run(..., check=True)` and records its CPU time and peak RSS.
+
+    `on_start` receives the process as soon as it is spawned, e.g. so another
+    thread can kill it.
+    """
+    metrics = metrics or get_metrics()
+    with metrics.span(f"{stage}.subprocess", video_id):
+        process = subprocess.Popen(command, **kwargs)
+        try:
+            if on_start is not None:
+                on_start(process)
+            _, status, usage = os.wait4(process.pid, 0)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is reported in kilobytes on Linux
+    metrics.record_subprocess(stage, usage.ru_utime + usage.ru_stime, usage.ru_maxrss * 1024, video_id)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return subprocess.CompletedProcess(command, process.returncode)
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+
+def set_metrics(metrics: Metrics) -> None:
+    global _metrics
+    _metrics = metrics
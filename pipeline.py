@@ -0,0 +1,407 @@
+import asyncio
+import functools
+import glob
+import logging
+import os
+import signal
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+from browser_pool import BrowserPool
+from cache import CacheMiss, DiskCache
+from clip_planner import PlannerSettings, plan_clips
+from heatmap import analyze_heatmap_data, extract_video_data
+from heatmap_array import HeatmapArray
+from manifest import JobManifest, RetryPolicy
+from metrics import Metrics, get_metrics
+from transcript import DEFAULT_PREFERENCES, resolve_transcript, get_significant_transcript_sections
+from workspace import Workspace
+from video_processing import DEFAULT_DOWNLOAD_HEIGHT, DOWNLOAD_MODES, SECTION_PADDING, EncoderSettings, create_clips, create_clips_from_sections, download_sections, download_video
+
+DEFAULT_VIDEO_URL_TEMPLATE = "https://www.youtube.com/watch?v={video_id}"
+
+
+@dataclass
+class StageLimits:
+    """Maximum number of videos allowed in each stage at the same time."""
+    download: int = 2
+    heatmap: int = 2
+    transcript: int = 4
+    clip: int = field(default_factory=lambda: os.cpu_count() or 1)
+
+
+def plan_analysis(video_data: Dict[str, Any], planner: Optional[PlannerSettings]) -> Dict[str, Any]:
+    """Adds the planned clip windows to the heatmap analysis and uses them as the rises to cut.
+
+    The raw threshold crossings are kept under `raw_rises`. Without a planner
+    the analysis is returned unchanged.
+    """
+    analysis = video_data.get('analysis', {}) if video_data else {}
+    if planner is None or not analysis:
+        return analysis
+    planned = plan_clips(HeatmapArray.from_points(video_data['heatmap_points']), video_data.get('duration') or 0.0, planner)
+    return {**analysis, 'raw_rises': analysis.get('significant_rises', []), 'significant_rises': planned, 'total_rises': len(planned)}
+
+
+def build_clip_sections(analysis: Dict[str, Any], transcript_sections: Dict[str, List[List[Dict[str, Any]]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Pairs each significant rise with its transcript entries in the shape `create_clips` expects."""
+    rises = analysis.get('significant_rises', [])
+    texts = transcript_sections.get('rises') or [[] for _ in rises]
+    return {'rises': [{'start': rise['start'], 'end': rise['end'], 'text': text} for rise, text in zip(rises, texts)]}
+
+
+def _kill(process: subprocess.Popen) -> None:
+    # Not process.kill(): it polls first and could reap the process before the thread running it does
+    try:
+        os.kill(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _downloaded_files_exist(artifacts: Union[None, str, List[Dict[str, Any]]]) -> bool:
+    if not artifacts:
+        return False
+    if isinstance(artifacts, str):
+        return os.path.exists(artifacts)
+    return all(os.path.exists(section['path']) for section in artifacts)
+
+
+def _clip_files_exist(clips: Optional[List[Dict[str, Any]]]) -> bool:
+    return all(os.path.exists(clip['output_path']) for clip in clips or [])
+
+
+class BatchPipeline:
+    """Runs download, heatmap, transcript and clip stages for many videos concurrently.
+
+    Each stage has its own limiter, so network-bound heatmap and transcript
+    fetches overlap with ffmpeg encodes and downloads of other videos.
+
+    With `download_mode="full"` the whole video downloads while its heatmap
+    and transcript are fetched; if it turns out to have no significant rises
+    the download is stopped and its partial files deleted. With
+    `download_mode="sections"` the download waits for the clip plan and
+    fetches only the planned windows plus `section_padding`, so such a video
+    is never downloaded at all. `video_url_template` points downloads at
+    another host, e.g. `standin_server.py`.
+
+    Sources are downloaded into the `workspace` (one per job, created from the
+    manifest's job ID when not given), deleted as soon as their clips are cut,
+    and new downloads wait while the workspace is close to its quota. Clips go
+    to `output_dir`, or to the workspace's clip directory when it is not set.
+    """
+
+    def __init__(self, output_dir: Optional[str] = None, limits: Optional[StageLimits] = None, pool: Optional[BrowserPool] = None, readiness: str = "event", cache: Optional[DiskCache] = None,
+                 transcript_preferences: Sequence[Tuple[str, str]] = DEFAULT_PREFERENCES,
+                 clip_mode: str = "fast", encoder: Optional[EncoderSettings] = None, single_pass: bool = False,
+                 manifest: Optional[JobManifest] = None, retry_policy: Optional[RetryPolicy] = None, metrics: Optional[Metrics] = None,
+                 planner: Optional[PlannerSettings] = PlannerSettings(), download_mode: str = "full",
+                 download_height: int = DEFAULT_DOWNLOAD_HEIGHT, section_padding: float = SECTION_PADDING,
+                 video_url_template: str = DEFAULT_VIDEO_URL_TEMPLATE, workspace: Optional[Workspace] = None):
+        if download_mode not in DOWNLOAD_MODES:
+            raise ValueError(f"Unsupported download mode: {download_mode}")
+        self.workspace = workspace or Workspace(job_id=manifest.job_id if manifest is not None else "default")
+        self.output_dir = output_dir or self.workspace.clips_dir
+        self.readiness = readiness
+        self.cache = cache
+        self.transcript_preferences = list(transcript_preferences)
+        self.clip_mode = clip_mode
+        self.encoder = encoder or EncoderSettings()
+        self.single_pass = single_pass
+        self.manifest = manifest
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.metrics = metrics or get_metrics()
+        self.planner = planner
+        self.download_mode = download_mode
+        self.download_height = download_height
+        self.section_padding = section_padding
+        self.video_url_template = video_url_template
+        self.limits = limits or StageLimits()
+        self.pool = pool
+        self._owns_pool = pool is None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._ffmpeg_executor: Optional[ThreadPoolExecutor] = None
+        self._abandoned: Set[str] = set()
+        self._download_threads: Dict[str, Optional[subprocess.Popen]] = {}
+
+    async def __aenter__(self) -> "BatchPipeline":
+        self.workspace.prepare()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._semaphores = {
+            'download': asyncio.Semaphore(self.limits.download),
+            'heatmap': asyncio.Semaphore(self.limits.heatmap),
+            'transcript': asyncio.Semaphore(self.limits.transcript),
+            'clip': asyncio.Semaphore(self.limits.clip),
+        }
+        workers = self.limits.download + self.limits.transcript + self.limits.clip
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline")
+        # Shared across videos so the number of concurrent ffmpeg processes stays at the core count
+        self._ffmpeg_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="ffmpeg")
+        if self.pool is None:
+            self.pool = BrowserPool(size=self.limits.heatmap)
+        await self.pool.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._owns_pool and self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._ffmpeg_executor is not None:
+            self._ffmpeg_executor.shutdown(wait=True)
+            self._ffmpeg_executor = None
+        # Leftovers of failed downloads, e.g. yt-dlp part files
+        self.workspace.clear_sources()
+
+    async def _run_blocking(self, stage: str, func: Callable, *args, **kwargs) -> Any:
+        async with self._semaphores[stage]:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def _download(self, video_id: str, sections: Optional[Dict[str, List[Dict[str, Any]]]] = None) -> Union[str, List[Dict[str, Any]]]:
+        """Returns the downloaded file path, or the list of downloaded sections when `sections` is given."""
+        video_url = self.video_url_template.format(video_id=video_id)
+        with self.metrics.span('workspace.acquire', video_id):
+            await self.workspace.acquire(video_id)
+        if sections is not None:
+            downloaded = await self._run_blocking('download', download_sections, video_url, sections['rises'], self.workspace.source_path(video_id),
+                                                  padding=self.section_padding, height=self.download_height)
+            if not downloaded:
+                raise RuntimeError("Section download failed")
+            return downloaded
+        video_path = await self._run_blocking('download', self._download_full, video_id, video_url)
+        if video_id in self._abandoned:
+            return None
+        if not video_path:
+            raise RuntimeError("Video download failed")
+        return video_path
+
+    def _download_full(self, video_id: str, video_url: str) -> Optional[str]:
+        # Runs on a worker thread; the yt-dlp process is registered so `_abandon_download` can kill it
+        self._download_threads[video_id] = None
+        try:
+            if video_id in self._abandoned:
+                return None
+            return download_video(video_url, self.workspace.source_path(f"{video_id}.mp4"), height=self.download_height,
+                                  on_start=functools.partial(self._register_download, video_id))
+        finally:
+            del self._download_threads[video_id]
+
+    def _register_download(self, video_id: str, process: subprocess.Popen) -> None:
+        self._download_threads[video_id] = process
+        if video_id in self._abandoned:
+            _kill(process)
+
+    async def _abandon_download(self, video_id: str, download_task: asyncio.Task) -> None:
+        """Stops a full download that is no longer needed and waits until nothing writes to its files.
+
+        Cancelling the task alone would leave the worker thread downloading, so
+        once the thread has started its yt-dlp process is killed and the task
+        is awaited instead.
+        """
+        # Stays set until the video is processed again, so a worker thread that is only now starting returns at once
+        self._abandoned.add(video_id)
+        if video_id in self._download_threads:
+            process = self._download_threads.get(video_id)
+            if process is not None:
+                _kill(process)
+        else:
+            # Still waiting for space or a download slot, so no thread is writing yet
+            download_task.cancel()
+        await asyncio.gather(download_task, return_exceptions=True)
+        logging.info(f"Stopped download of video ID {video_id}")
+
+    async def _heatmap(self, video_id: str) -> Dict[str, Any]:
+        if self.cache is not None:
+            cached = self.cache.get(video_id, 'heatmap')
+            if cached is not None:
+                return {**cached, 'analysis': analyze_heatmap_data(cached['heatmap_points']), 'source': 'cache'}
+            if self.cache.offline:
+                raise CacheMiss(f"heatmap for video ID {video_id} is not cached")
+
+        async with self._semaphores['heatmap']:
+            video_data = await extract_video_data(video_id, self.pool, readiness=self.readiness)
+
+        if self.cache is not None:
+            # Empty results are cached too, so reruns skip the page load, but expire sooner
+            ttl = self.cache.ttls['heatmap'] if video_data.get('heatmap_points') else self.cache.ttls['heatmap_empty']
+            self.cache.set(video_id, 'heatmap', {key: video_data[key] for key in ('video_id', 'duration', 'heatmap_points')}, ttl)
+        return video_data
+
+    def _fetch_transcript(self, video_id: str) -> Dict[str, Any]:
+        if self.cache is None:
+            transcript, source = resolve_transcript(video_id, self.transcript_preferences)
+            return {'transcript': transcript, 'source': source}
+
+        # Keyed by the preference chain so a different language choice is not served a stale track
+        chain = ','.join(f"{kind}:{language}" for kind, language in self.transcript_preferences)
+        key = f"{video_id}|{chain}"
+        resolved = self.cache.get(key, 'transcript')
+        if resolved is not None:
+            return resolved
+        if self.cache.offline:
+            # The transcript is optional, so a miss only costs the clips their subtitles
+            logging.warning(f"Transcript for video ID {video_id} is not cached; continuing without it")
+            return {'transcript': None, 'source': None}
+        transcript, source = resolve_transcript(video_id, self.transcript_preferences, self.cache)
+        resolved = {'transcript': transcript, 'source': source}
+        # Videos without a transcript are cached too, but re-checked sooner
+        self.cache.set(key, 'transcript', resolved, self.cache.ttls['transcript' if transcript else 'transcript_empty'])
+        return resolved
+
+    async def _transcript(self, video_id: str) -> Dict[str, Any]:
+        return await self._run_blocking('transcript', self._fetch_transcript, video_id)
+
+    async def _stage(self, video_id: str, stage: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Runs one stage with retries, reusing the manifest artifacts when it already completed."""
+        if self.manifest is not None and self.manifest.is_done(video_id, stage):
+            artifacts = self.manifest.artifacts(video_id, stage)
+            # Finished downloads and clips only count if their files are still on disk, e.g. not exported and cleared
+            if (stage != 'download' or _downloaded_files_exist(artifacts)) and (stage != 'clip' or _clip_files_exist(artifacts)):
+                logging.info(f"Skipping completed {stage} stage for video ID {video_id}")
+                self.metrics.increment('manifest_skips', stage=stage)
+                return artifacts
+
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.manifest is not None:
+                self.manifest.mark_running(video_id, stage)
+            try:
+                with self.metrics.span(stage, video_id, attempt=attempt):
+                    value = await func()
+            except Exception as e:
+                if self.manifest is not None:
+                    self.manifest.mark_failed(video_id, stage, str(e))
+                if isinstance(e, CacheMiss) or attempt >= self.retry_policy.max_attempts:
+                    raise
+                delay = self.retry_policy.delay(attempt)
+                self.metrics.increment('retries', stage=stage)
+                logging.warning(f"{stage} failed for video ID {video_id} (attempt {attempt}): {e}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            if self.manifest is not None:
+                self.manifest.mark_done(video_id, stage, value)
+            return value
+
+    async def process_video(self, video_id: str) -> Dict[str, Any]:
+        result = {'video_id': video_id, 'status': 'failed', 'clips': [], 'error': None}
+        if self.manifest is not None and self.manifest.is_done(video_id, 'clip') and _clip_files_exist(self.manifest.artifacts(video_id, 'clip')):
+            result.update(status='done', clips=self.manifest.artifacts(video_id, 'clip') or [], resumed=True)
+            return result
+        with self.metrics.span('video', video_id):
+            await self._process_video(video_id, result)
+        self.metrics.increment('videos', status=result['status'])
+        return result
+
+    async def _process_video(self, video_id: str, result: Dict[str, Any]) -> None:
+        download_task = None
+        downloaded = None
+        if self.download_mode == 'full':
+            self._abandoned.discard(video_id)
+            download_task = asyncio.create_task(self._stage(video_id, 'download', lambda: self._download(video_id)))
+        try:
+            video_data, resolved = await asyncio.gather(
+                self._stage(video_id, 'heatmap', lambda: self._heatmap(video_id)),
+                self._stage(video_id, 'transcript', lambda: self._transcript(video_id))
+            )
+            transcript = resolved['transcript']
+            result['transcript_source'] = resolved['source']
+            analysis = plan_analysis(video_data, self.planner)
+            result['analysis'] = analysis
+            result['page_timings'] = video_data.get('timings', {}) if video_data else {}
+            sections = build_clip_sections(analysis, get_significant_transcript_sections(transcript, analysis))
+            result['significant_transcript_sections'] = sections
+            if not sections['rises']:
+                logging.info(f"No significant rises for video ID {video_id}, skipping download")
+                self.metrics.increment('skipped_videos', reason='no_rises')
+                result.update(status='done', skipped='no significant rises')
+                return
+
+            clip_options = dict(mode=self.clip_mode, encoder=self.encoder, executor=self._ffmpeg_executor, single_pass=self.single_pass)
+            if download_task is None:
+                downloaded = await self._stage(video_id, 'download', lambda: self._download(video_id, sections))
+                result['clips'] = await self._stage(video_id, 'clip', lambda: self._run_blocking(
+                    'clip', create_clips_from_sections, video_id, sections, downloaded, self.output_dir, **clip_options
+                ))
+            else:
+                downloaded = await download_task
+                result['clips'] = await self._stage(video_id, 'clip', lambda: self._run_blocking(
+                    'clip', create_clips, video_id, sections, downloaded, self.output_dir, **clip_options
+                ))
+            result['status'] = 'done'
+        except Exception as e:
+            logging.error(f"Processing failed for video ID {video_id}: {e}")
+            result['error'] = str(e)
+        finally:
+            if download_task is not None and not download_task.done():
+                await self._abandon_download(video_id, download_task)
+            if isinstance(downloaded, list):
+                source_paths = [section['path'] for section in downloaded]
+            else:
+                # Includes the part files of a stopped or failed download
+                source_paths = glob.glob(self.workspace.source_path(f"{glob.escape(video_id)}.*"))
+            await self.workspace.release(video_id, source_paths)
+
+    async def run(self, video_ids: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[Dict[str, Any]]:
+        """Yields one result per video as soon as that video finishes.
+
+        `video_ids` may be an async iterable (e.g. `sources.stream_video_ids`), in
+        which case videos start processing while enumeration is still running.
+        Repeated IDs are processed once.
+        """
+        results: asyncio.Queue = asyncio.Queue()
+        seen = set()
+        pending = 0
+
+        def start(video_id: str) -> None:
+            nonlocal pending
+            if video_id in seen:
+                return
+            seen.add(video_id)
+            pending += 1
+            task = asyncio.create_task(self.process_video(video_id))
+            task.add_done_callback(results.put_nowait)
+
+        async def feed() -> None:
+            if isinstance(video_ids, AsyncIterable):
+                async for video_id in video_ids:
+                    start(video_id)
+            else:
+                for video_id in video_ids:
+                    start(video_id)
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while not feeder.done() or pending:
+                waiter = asyncio.create_task(results.get())
+                await asyncio.wait({waiter} if feeder.done() else {waiter, feeder}, return_when=asyncio.FIRST_COMPLETED)
+                if not waiter.done():
+                    waiter.cancel()
+                    continue
+                pending -= 1
+                yield waiter.result().result()
+            feeder.result()
+        finally:
+            feeder.cancel()
+
+
+async def run_batch_async(video_ids: Union[Iterable[str], AsyncIterable[str]], on_result: Optional[Callable[[Dict[str, Any]], None]] = None, **kwargs) -> List[Dict[str, Any]]:
+    results = []
+    async with BatchPipeline(**kwargs) as pipeline:
+        async for result in pipeline.run(video_ids):
+            if on_result:
+                on_result(result)
+            results.append(result)
+    for stage, stats in pipeline.metrics.summary()['stages'].items():
+        logging.info(f"Stage {stage}: {stats['count']} runs, p50 {stats['p50_seconds']:.3f}s, p90 {stats['p90_seconds']:.3f}s, "
+                     f"p99 {stats['p99_seconds']:.3f}s, max {stats['max_seconds']:.3f}s")
+    return results
+
+
+def run_batch(video_ids: Union[Iterable[str], AsyncIterable[str]], on_result: Optional[Callable[[Dict[str, Any]], None]] = None, **kwargs) -> List[Dict[str, Any]]:
+    """Synchronous entry point; `on_result` is called on the calling thread as each video completes."""
+    return asyncio.run(run_batch_async(video_ids, on_result, **kwargs))
@@ -0,0 +1,78 @@
+import logging
+import threading
+from collections import deque
+
+
+class Reporter:
+    """Receives user-facing progress messages; the default implementation logs them."""
+
+    def info(self, message: str) -> None:
+        logging.info(message)
+
+    def success(self, message: str) -> None:
+        logging.info(message)
+
+    def warning(self, message: str) -> None:
+        logging.warning(message)
+
+    def error(self, message: str) -> None:
+        logging.error(message)
+
+
+class StreamlitReporter(Reporter):
+    """Shows messages in the Streamlit page as well as the log.
+
+    Streamlit drops elements written from threads without a script run
+    context, such as the pipeline's worker threads, so their messages are
+    queued and rendered by the next `flush` (or message) on the script thread
+    that created the reporter.
+    """
+
+    def __init__(self):
+        import streamlit as st
+        self._st = st
+        self._script_thread = threading.get_ident()
+        self._pending = deque()
+
+    def _show(self, kind: str, message: str) -> None:
+        if threading.get_ident() != self._script_thread:
+            self._pending.append((kind, message))
+            return
+        self.flush()
+        getattr(self._st, kind)(message)
+
+    def flush(self) -> None:
+        """Renders the messages queued by other threads; call it from the script thread."""
+        if threading.get_ident() != self._script_thread:
+            return
+        while self._pending:
+            kind, message = self._pending.popleft()
+            getattr(self._st, kind)(message)
+
+    def info(self, message: str) -> None:
+        super().info(message)
+        self._show('info', message)
+
+    def success(self, message: str) -> None:
+        super().success(message)
+        self._show('success', message)
+
+    def warning(self, message: str) -> None:
+        super().warning(message)
+        self._show('warning', message)
+
+    def error(self, message: str) -> None:
+        super().error(message)
+        self._show('error', message)
+
+
+_reporter = Reporter()
+
+
+def get_reporter() -> Reporter:
+    return _reporter
+
+
+def set_reporter(reporter: Reporter) -> None:
+    global _reporter
+    _reporter = reporter
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import urllib.request
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List, Optional, Sequence
+from urllib.parse import urlparse, parse_qs
+from youtubesearchpython import Playlist, playlist_from_channel_id
+from browser_pool import USER_AGENTS
+
+# Maps a playlist URL to an iterator of pages, each page being a list of video IDs
+PageSource = Callable[[str], Iterator[List[str]]]
+
+CHANNEL_ID_PATTERNS = (
+    re.compile(r'<link rel="canonical" href="https://www\.youtube\.com/channel/(UC[\w-]{22})"'),
+    re.compile(r'"externalId":"(UC[\w-]{22})"'),
+)
+
+
+def parse_video_id(video_url: str) -> str:
+    """Extracts the video ID from a watch, youtu.be or shorts URL; bare IDs are returned unchanged."""
+    parsed = urlparse(video_url.strip())
+    if parsed.netloc.endswith('youtu.be'):
+        return parsed.path.lstrip('/')
+    if parsed.path.startswith('/shorts/'):
+        return parsed.path.split('/')[2]
+    query_id = parse_qs(parsed.query).get('v')
+    if query_id:
+        return query_id[0]
+    return video_url.strip().split('v=')[-1]
+
+
+def channel_id_from_url(channel_url: str) -> Optional[str]:
+    """Returns the UC... ID of a /channel/UC... URL (with or without a tab such as /videos) or bare ID."""
+    segments = [segment for segment in urlparse(channel_url.strip()).path.split('/') if segment]
+    if len(segments) == 1 and segments[0].startswith('UC'):
+        return segments[0]
+    for previous, segment in zip(segments, segments[1:]):
+        if previous == 'channel' and segment.startswith('UC'):
+            return segment
+    return None
+
+
+def parse_channel_id(page_html: str) -> Optional[str]:
+    """Finds the channel ID in the HTML of a channel page, e.g. one reached through an @handle URL."""
+    for pattern in CHANNEL_ID_PATTERNS:
+        match = pattern.search(page_html)
+        if match:
+            return match.group(1)
+    return None
+
+
+def fetch_channel_page(channel_url: str, timeout: float = 15.0) -> str:
+    url = channel_url.strip()
+    if url.startswith('@'):
+        url = f"https://www.youtube.com/{url}"
+    request = urllib.request.Request(url, headers={
+        'User-Agent': random.choice(USER_AGENTS),
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Cookie': 'CONSENT=YES+1',
+    })
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        charset = response.headers.get_content_charset() or 'utf-8'
+        return response.read().decode(charset, errors='replace')
+
+
+def channel_playlist_url(channel_url: str) -> str:
+    """Returns the uploads playlist URL for a channel URL or bare channel ID.
+
+    /channel/UC... URLs resolve locally; @handle, /c/ and /user/ URLs need one
+    fetch of the channel page to read its ID.
+    """
+    channel_id = channel_id_from_url(channel_url)
+    if channel_id is None:
+        try:
+            channel_id = parse_channel_id(fetch_channel_page(channel_url))
+        except OSError as e:
+            raise ValueError(f"Could not load channel page {channel_url.strip()}: {e}") from e
+    if channel_id is None:
+        raise ValueError(f"Could not find a channel ID for {channel_url.strip()}")
+    return playlist_from_channel_id(channel_id)
+
+
+def iter_playlist_pages(playlist_url: str) -> Iterator[List[str]]:
+    """Yields the video IDs of each continuation page of a playlist as it is fetched."""
+    playlist = Playlist(playlist_url)
+    seen = 0
+    while True:
+        # `Playlist.videos` accumulates across pages, so only the new tail is yielded
+        page = [video['id'] for video in playlist.videos[seen:]]
+        seen = len(playlist.videos)
+        if page:
+            yield page
+        if not playlist.hasMoreVideos:
+            return
+        playlist.getNextVideos()
+
+
+def playlist_page_video_ids(response: Any) -> List[str]:
+    """Video IDs of a raw playlist browse response (first page or continuation), in page order."""
+    video_ids = []
+    stack = [response]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            renderer = node.get('playlistVideoRenderer')
+            if isinstance(renderer, dict) and 'videoId' in renderer:
+                video_ids.append(renderer['videoId'])
+                continue
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return video_ids
+
+
+def recorded_pages(fixture_path: str) -> PageSource:
+    """Returns a `PageSource` that replays recorded browse responses instead of fetching them.
+
+    The fixture maps each playlist URL to its raw responses, first page first
+    (see fixtures/playlist_pages.json).
+    """
+    with open(fixture_path, 'r', encoding='utf-8') as fixture:
+        recorded = json.load(fixture)
+
+    def pages(playlist_url: str) -> Iterator[List[str]]:
+        for response in recorded[playlist_url]:
+            yield playlist_page_video_ids(response)
+    return pages
+
+
+def dedupe(video_ids: Iterable[str]) -> List[str]:
+    """Removes repeated IDs, keeping the first occurrence of each."""
+    return list(dict.fromkeys(video_ids))
+
+
+def collect_video_ids(video_urls: Sequence[str], playlist_urls: Sequence[str], channel_urls: Sequence[str],
+                      pages: PageSource = iter_playlist_pages) -> List[str]:
+    """Blocking variant of `stream_video_ids` that returns the whole de-duplicated list."""
+    async def gather() -> List[str]:
+        return [video_id async for video_id in stream_video_ids(video_urls, playlist_urls, channel_urls, pages=pages)]
+    return asyncio.run(gather())
+
+
+async def stream_video_ids(video_urls: Sequence[str], playlist_urls: Sequence[str], channel_urls: Sequence[str],
+                           max_concurrency: int = 4, pages: PageSource = iter_playlist_pages) -> AsyncIterator[str]:
+    """Expands playlists and channels concurrently and yields each new video ID as its page arrives.
+
+    Direct video URLs come first; IDs already seen from any source are skipped.
+    `pages` can be replaced with `recorded_pages(...)` to replay page fixtures.
+    """
+    seen = set()
+    for url in video_urls:
+        if url.strip():
+            video_id = parse_video_id(url)
+            if video_id not in seen:
+                seen.add(video_id)
+                yield video_id
+
+    # Channels are resolved on the worker threads, since @handle URLs need a page fetch
+    playlist_sources = [(url.strip(), None) for url in playlist_urls if url.strip()]
+    playlist_sources += [(url.strip(), channel_playlist_url) for url in channel_urls if url.strip()]
+    if not playlist_sources:
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    done_marker = object()
+
+    def expand(url: str, resolve: Optional[Callable[[str], str]]) -> None:
+        try:
+            playlist_url = resolve(url) if resolve else url
+        except ValueError as e:
+            logging.error(f"Skipping channel {url}: {e}")
+            return
+        try:
+            for page in pages(playlist_url):
+                loop.call_soon_threadsafe(queue.put_nowait, page)
+        except Exception as e:
+            logging.error(f"Failed to enumerate {playlist_url}: {e}")
+
+    async def worker(url: str, resolve: Optional[Callable[[str], str]]) -> None:
+        async with semaphore:
+            await asyncio.to_thread(expand, url, resolve)
+        # Queued after all of this source's pages because call_soon_threadsafe callbacks run in order
+        loop.call_soon_threadsafe(queue.put_nowait, done_marker)
+
+    workers = [asyncio.create_task(worker(url, resolve)) for url, resolve in playlist_sources]
+    remaining = len(workers)
+    try:
+        while remaining:
+            page = await queue.get()
+            if page is done_marker:
+                remaining -= 1
+                continue
+            for video_id in page:
+                if video_id not in seen:
+                    seen.add(video_id)
+                    yield video_id
+    finally:
+        for task in workers:
+            task.cancel()
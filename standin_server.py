@@ -0,0 +1,121 @@
+import argparse
+import logging
+import os
+import re
+import shutil
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+DEFAULT_VIDEO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "sample.mp4")
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Returns the inclusive `(start, end)` byte range of a single-range `Range` header.
+
+    Returns None when there is no usable header (serve the whole file) and
+    raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    if match.group(1) == '':
+        # Suffix range: the last N bytes
+        start, end = max(0, size - int(match.group(2))), size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"Range {header!r} not satisfiable for {size} bytes")
+    return start, end
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves one video file for every path, honouring byte ranges like a CDN would."""
+
+    def __init__(self, *args, video_path: str = DEFAULT_VIDEO, **kwargs):
+        self.video_path = video_path
+        super().__init__(*args, **kwargs)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _respond(self, send_body: bool) -> None:
+        size = os.path.getsize(self.video_path)
+        try:
+            byte_range = parse_range(self.headers.get('Range'), size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.end_headers()
+            return
+        start, end = byte_range or (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if byte_range:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not send_body:
+            return
+        with open(self.video_path, 'rb') as video_file:
+            video_file.seek(start)
+            try:
+                shutil.copyfileobj(_LimitedReader(video_file, end - start + 1), self.wfile)
+            except (BrokenPipeError, ConnectionResetError):
+                # Clients such as ffmpeg close the connection once they have read what they need
+                pass
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+class _LimitedReader:
+    def __init__(self, file, remaining: int):
+        self.file = file
+        self.remaining = remaining
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8000, video_path: str = DEFAULT_VIDEO) -> ThreadingHTTPServer:
+    """Builds a local stand-in for the video host; pair it with `--video-url-template`.
+
+    Use port 0 for a free port and read it back from `server.server_address`.
+    """
+    return ThreadingHTTPServer((host, port), partial(StandInHandler, video_path=video_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local video over HTTP with range support, standing in for YouTube downloads")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--video', default=DEFAULT_VIDEO, help="File served for every requested path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = create_server(args.host, args.port, args.video)
+    host, port = server.server_address[:2]
+    logging.info(f"Serving {args.video} at http://{host}:{port}/, e.g. --video-url-template \"http://{host}:{port}/{{video_id}}.mp4\"")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,35 @@
-import asyncio
 import logging
 import streamlit as st
 import os
-from transcript import fetch_transcript, get_significant_transcript_sections
-from heatmap import parse_svg_heatmap, analyze_heatmap_data, extract_video_data, extract_heatmap_svgs
-from video_processing import download_video, create_clips, get_video_ids_from_playlist, get_video_ids_from_channel
-from utils import download_clips_as_zip, save_json, download_clips_with_srt_as_zip
-
-os.system('playwright install')
+from sources import stream_video_ids
+from browser_pool import install_browsers
+from reporting import StreamlitReporter, set_reporter
+from clip_planner import PlannerSettings
+from pipeline import run_batch
+from cache import DiskCache
+from transcript import build_preferences
+from manifest import JobManifest, job_id_for
+from workspace import Workspace
+from utils import write_clips_zip
 
+# Streamlit holds a download button's data in server memory, so parts stay small
+# and only the selected part is ever loaded
+MAX_ARCHIVE_BYTES = 200 * 1024 ** 2
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+@st.cache_resource
+def ensure_browsers_installed() -> bool:
+    # Runs once per server process instead of on every script rerun
+    install_browsers()
+    return True
+
 # Streamlit app
 def main():
+    reporter = StreamlitReporter()
+    set_reporter(reporter)
+    ensure_browsers_installed()
     st.title("YouTube Video Short Clips Generator")
 
     # Input fields for video URLs, playlist URLs, and channel URLs
@@ -22,42 +37,47 @@ def main():
     playlist_urls = st.text_area("Enter YouTube playlist URLs (comma-separated):")
     channel_urls = st.text_area("Enter YouTube channel URLs (comma-separated):")
     subtitle_language = st.text_input("Enter subtitle language code (e.g., 'tr' for Turkish):", value="tr")
+    clips_per_video = st.number_input("Maximum clips per video:", min_value=1, max_value=20, value=PlannerSettings.top_k)
 
     if st.button("Generate Clips"):
         if not video_urls and not playlist_urls and not channel_urls:
             st.warning("Please enter at least one video, playlist, or channel URL.")
         else:
-            video_ids_list = []
-            if video_urls:
-                video_ids_list.extend([url.strip().split('v=')[-1] for url in video_urls.split(",")])
-            if playlist_urls:
-                for url in playlist_urls.split(","):
-                    video_ids_list.extend(get_video_ids_from_playlist(url.strip()))
-            if channel_urls:
-                for url in channel_urls.split(","):
-                    video_ids_list.extend(get_video_ids_from_channel(url.strip()))
+            inputs = [video_urls.split(","), playlist_urls.split(","), channel_urls.split(",")]
+            video_ids = stream_video_ids(*inputs)
 
             all_clips = []
 
-            for video_id in video_ids_list:
-                st.info(f"Processing video ID: {video_id}")
-                video_url = f"https://www.youtube.com/watch?v={video_id}"
-                video_path = f"{video_id}.mp4"
-                download_video(video_url, video_path)
+            def on_result(result):
+                # Runs on the script thread, so messages queued by the pipeline's worker threads can be shown now
+                reporter.flush()
+                if result['status'] == 'done':
+                    st.info(f"Finished video ID: {result['video_id']} ({len(result['clips'])} clips)")
+                    all_clips.extend(result['clips'])
+                else:
+                    st.error(f"Data extraction failed for video ID: {result['video_id']}. Please check the video ID and try again.")
 
-                # Extract video data
-                output_json = asyncio.run(extract_video_data(video_id))
+            preferences = build_preferences(subtitle_language.strip() or "tr")
+            # Reruns with the same inputs resume from the manifest instead of starting over
+            planner = PlannerSettings(top_k=int(clips_per_video))
+            manifest = JobManifest(job_id=job_id_for(sum(inputs, []), preferences=preferences, top_k=planner.top_k))
+            workspace = Workspace(job_id=manifest.job_id)
+            run_batch(video_ids, on_result=on_result, cache=DiskCache(), transcript_preferences=preferences,
+                      manifest=manifest, planner=planner, workspace=workspace)
+            reporter.flush()
+            manifest.close()
 
-                if output_json:
-                    significant_sections = output_json.get('significant_transcript_sections', {'rises': []})
-                    clips = create_clips(video_id, significant_sections, video_path, "clips")
-                    all_clips.extend(clips)
-                else:
-                    st.error(f"Data extraction failed for video ID: {video_id}. Please check the video ID and try again.")
+            st.session_state['archive_paths'] = write_clips_zip(all_clips, os.path.join(workspace.job_dir, "clips_with_srt.zip"),
+                                                                max_archive_bytes=MAX_ARCHIVE_BYTES) if all_clips else []
+            # The archives hold every clip, so only they stay on disk; they are evicted under the quota once the job is idle
+            workspace.clear_clips()
 
-            if all_clips:
-                zip_buffer = download_clips_with_srt_as_zip(all_clips)
-                st.download_button(label="Download Clips with SRT as ZIP", data=zip_buffer, file_name="clips_with_srt.zip", mime="application/zip")
+    # Rendered on every rerun, so picking another part replaces the previous one in memory
+    archive_paths = [path for path in st.session_state.get('archive_paths', []) if os.path.exists(path)]
+    if archive_paths:
+        archive_path = st.selectbox("Archive part:", archive_paths, format_func=os.path.basename)
+        with open(archive_path, 'rb') as archive:
+            st.download_button(label=f"Download {os.path.basename(archive_path)}", data=archive, file_name=os.path.basename(archive_path), mime="application/zip")
 
 if __name__ == "__main__":
     main()
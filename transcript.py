@@ -1,101 +1,178 @@
-from typing import List, Dict, Any, Optional
+import json
+import time
+import urllib.parse
+import urllib.request
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
+import numpy as np
 import yt_dlp
-import streamlit as st
+from cache import CacheMiss, DiskCache
+from metrics import get_metrics
+from reporting import get_reporter
 
-def fetch_transcript(video_id: str) -> Optional[List[Dict[str, Any]]]:
-    """Fetches transcript data from YouTube with fallback for 'TranscriptsDisabled'."""
+# Signed subtitle URLs are treated as expired this long before their `expire` time
+SIGNED_URL_MARGIN = 5 * 60
+
+# Each preference is (kind, language_code) where kind is 'manual', 'generated' or 'translated'
+DEFAULT_PREFERENCES: List[Tuple[str, str]] = [('manual', 'tr'), ('manual', 'en'), ('generated', 'tr'), ('translated', 'tr')]
+
+TRANSCRIPT_KINDS = ('manual', 'generated', 'translated')
+
+def build_preferences(language: str, fallback_language: str = 'en') -> List[Tuple[str, str]]:
+    """Builds the default priority chain for a user-selected subtitle language."""
+    chain = [('manual', language), ('manual', fallback_language), ('generated', language), ('generated', fallback_language), ('translated', language)]
+    return list(dict.fromkeys(chain))
+
+def _find_listed_transcript(transcript_list, kind: str, language: str):
+    if kind == 'manual':
+        return transcript_list._manually_created_transcripts.get(language)
+    if kind == 'generated':
+        return transcript_list._generated_transcripts.get(language)
+    for transcript in list(transcript_list._manually_created_transcripts.values()) + list(transcript_list._generated_transcripts.values()):
+        if transcript.is_translatable and any(lang['language_code'] == language for lang in transcript.translation_languages):
+            return transcript.translate(language)
+    return None
+
+def _raw_transcript_data(transcript_data) -> List[Dict[str, Any]]:
+    return transcript_data.to_raw_data() if hasattr(transcript_data, 'to_raw_data') else transcript_data
+
+def resolve_transcript(video_id: str, preferences: Sequence[Tuple[str, str]] = DEFAULT_PREFERENCES, cache: Optional[DiskCache] = None) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+    """Lists the available tracks once and returns the first match in `preferences`.
+
+    Returns `(transcript, source)`, where source names the backend, kind and
+    language used (e.g. "youtube_transcript_api:manual:tr"). yt-dlp is only
+    consulted when the transcript API reports transcripts as disabled.
+    """
+    for kind, _ in preferences:
+        if kind not in TRANSCRIPT_KINDS:
+            raise ValueError(f"Unsupported transcript kind: {kind}")
     try:
         transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-        # Try to get a manually created Turkish transcript
-        if 'tr' in transcript_list._manually_created_transcripts:
-            transcript = transcript_list.find_manually_created_transcript(['tr'])
-            st.success("Turkish manually created transcript found.")
-            transcript_data = transcript.fetch()
-            return transcript_data
-        # Try to get a manually created English transcript
-        elif 'en' in transcript_list._manually_created_transcripts:
-            transcript = transcript_list.find_manually_created_transcript(['en'])
-            st.success("English manually created transcript found.")
-            transcript_data = transcript.fetch()
-            return transcript_data
-        # Try to get auto-generated Turkish transcript
-        elif 'tr' in transcript_list._generated_transcripts:
-            transcript = transcript_list.find_generated_transcript(['tr'])
-            st.success("Turkish auto-generated transcript found.")
-            transcript_data = transcript.fetch()
-            return transcript_data
-        else:
-            st.error("No manually created or auto-generated transcripts found in Turkish or English.")
-            return None
-
     except TranscriptsDisabled:
-        st.warning("Transcripts are disabled using list_transcripts method, attempting fallback method...")
-        return fetch_transcript_fallback(video_id)
-    except NoTranscriptFound:
-        st.error("No transcripts found for this video.")
-        return None
+        get_reporter().warning("Transcripts are disabled using list_transcripts method, attempting yt-dlp fallback method...")
+        get_metrics().increment('fallbacks', stage='transcript', to='yt_dlp')
+        with get_metrics().span('transcript.yt_dlp', video_id):
+            return fetch_transcript_yt_dlp(video_id, cache, preferences)
     except Exception as e:
-        st.error(f"An error occurred: {e}")
-        return None
+        get_reporter().error(f"An error occurred: {e}")
+        return None, None
 
-def fetch_transcript_fallback(video_id: str) -> Optional[List[Dict[str, Any]]]:
-    """Fallback method to fetch transcript using get_transcript."""
-    try:
-        transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
+    for rank, (kind, language) in enumerate(preferences):
+        transcript = _find_listed_transcript(transcript_list, kind, language)
+        if transcript is None:
+            continue
+        try:
+            transcript_data = _raw_transcript_data(transcript.fetch())
+        except NoTranscriptFound:
+            continue
+        except Exception as e:
+            get_reporter().warning(f"Fetching the {kind} {language} transcript failed, trying the next preference: {e}")
+            continue
+        if rank:
+            get_metrics().increment('fallbacks', stage='transcript', to=kind)
+        source = f"youtube_transcript_api:{kind}:{language}"
+        get_reporter().success(f"Transcript found ({kind}, {language}).")
+        return transcript_data, source
 
-        if 'tr' in transcript_list._manually_created_transcripts:
-            transcript = transcript_list.find_manually_created_transcript(['tr'])
-            st.success("Turkish manually created transcript found using fallback method.")
-            transcript_data = transcript.fetch()
-            return transcript_data
-        elif 'en' in transcript_list._manually_created_transcripts:
-            transcript = transcript_list.find_manually_created_transcript(['en'])
-            st.success("English manually created transcript found using fallback method.")
-            transcript_data = transcript.fetch()
-            return transcript_data
-        else:
-            transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=['tr'])
-            st.success("Turkish transcript fetched using fallback method.")
-            return transcript
+    get_reporter().error(f"No transcript matched the preferences: {', '.join(f'{kind} {language}' for kind, language in preferences)}")
+    return None, None
 
-    except TranscriptsDisabled:
-        st.warning("Transcripts are disabled even using fallback method, attempting yt-dlp fallback method...")
-        return fetch_transcript_yt_dlp(video_id)
-    except NoTranscriptFound:
-        st.error("No transcripts found using fallback method.")
-        return None
-    except Exception as e:
-        st.error(f"An error occurred in fallback method: {e}")
+def fetch_transcript(video_id: str, cache: Optional[DiskCache] = None, preferences: Sequence[Tuple[str, str]] = DEFAULT_PREFERENCES) -> Optional[List[Dict[str, Any]]]:
+    """Fetches transcript data from YouTube following the `preferences` chain."""
+    transcript_data, _ = resolve_transcript(video_id, preferences, cache)
+    return transcript_data
+
+def signed_url_ttl(info_dict: Dict[str, Any]) -> Optional[float]:
+    """Seconds until the first signed subtitle URL in `info_dict` expires (minus a margin), or None if none is signed."""
+    expiries = []
+    for tracks in (info_dict.get('subtitles') or {}, info_dict.get('automatic_captions') or {}):
+        for formats in tracks.values():
+            for subtitle in formats:
+                expire = urllib.parse.parse_qs(urllib.parse.urlsplit(subtitle.get('url') or '').query).get('expire')
+                if expire and expire[0].isdigit():
+                    expiries.append(int(expire[0]))
+    if not expiries:
         return None
+    return min(expiries) - time.time() - SIGNED_URL_MARGIN
 
-def fetch_transcript_yt_dlp(video_id: str) -> Optional[List[Dict[str, Any]]]:
-    """Fallback method to fetch transcript using yt-dlp."""
-    try:
+def fetch_video_info(video_id: str, cache: Optional[DiskCache] = None) -> Dict[str, Any]:
+    """Extracts yt-dlp metadata (including subtitle tracks), reusing the cache when given.
+
+    The subtitle URLs are signed and expire sooner than the `info` TTL, so
+    entries are cached only until the first of them expires.
+    """
+    def extract() -> Dict[str, Any]:
         ydl_opts = {
-            'writesubtitles': True,
-            'subtitleslangs': ['tr'],
             'skip_download': True,
         }
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info_dict = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
+            return ydl.sanitize_info(info_dict)
 
-            if 'subtitles' in info_dict and 'tr' in info_dict['subtitles']:
-                subtitles = info_dict['subtitles']['tr']
-                srt_content = yt_dlp.utils.get_first(subtitles, {}).get('data', '')
-                if srt_content:
-                    st.success("Turkish transcript fetched using yt_dlp fallback method.")
-                    return parse_srt(srt_content)
-                else:
-                    st.error("No subtitles found in yt_dlp output.")
-                    return None
-            else:
-                st.error("No Turkish subtitles found using yt_dlp")
-                return None
+    if cache is None:
+        return extract()
+    info_dict = cache.get(video_id, 'info')
+    if info_dict is not None:
+        return info_dict
+    if cache.offline:
+        raise CacheMiss(f"info for video ID {video_id} is not cached")
+    info_dict = extract()
+    ttl = cache.ttls.get('info')
+    url_ttl = signed_url_ttl(info_dict)
+    if url_ttl is not None:
+        ttl = url_ttl if ttl is None else min(ttl, url_ttl)
+    if ttl is None or ttl > 0:
+        cache.set(video_id, 'info', info_dict, ttl)
+    return info_dict
+
+def _download_subtitle_track(formats: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    for subtitle in formats:
+        if subtitle.get('data'):
+            return parse_srt(subtitle['data'])
+    for subtitle in formats:
+        if subtitle.get('ext') == 'json3' and subtitle.get('url'):
+            with urllib.request.urlopen(subtitle['url'], timeout=30) as response:
+                return parse_json3(response.read().decode('utf-8'))
+    return None
+
+def fetch_transcript_yt_dlp(video_id: str, cache: Optional[DiskCache] = None, preferences: Sequence[Tuple[str, str]] = DEFAULT_PREFERENCES) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+    """Fallback method to fetch transcript using yt-dlp, with a single metadata extraction."""
+    try:
+        info_dict = fetch_video_info(video_id, cache)
+        tracks = {'manual': info_dict.get('subtitles') or {}, 'generated': info_dict.get('automatic_captions') or {}}
+        for kind, language in preferences:
+            formats = tracks.get(kind, {}).get(language)
+            if not formats:
+                continue
+            try:
+                transcript_data = _download_subtitle_track(formats)
+            except (OSError, ValueError) as e:
+                get_reporter().warning(f"Downloading the {kind} {language} subtitles failed, trying the next preference: {e}")
+                continue
+            if transcript_data:
+                get_reporter().success(f"Transcript fetched using yt_dlp fallback method ({kind}, {language}).")
+                return transcript_data, f"yt_dlp:{kind}:{language}"
+
+        get_reporter().error("No matching subtitles found using yt_dlp")
+        return None, None
 
     except Exception as e:
-        st.error(f"An error occurred in yt_dlp fallback method: {e}")
-        return None
+        get_reporter().error(f"An error occurred in yt_dlp fallback method: {e}")
+        return None, None
+
+def parse_json3(json3_content: str) -> List[Dict[str, Any]]:
+    """Parses YouTube json3 caption content into transcript entries with float seconds."""
+    transcript = []
+    for event in json.loads(json3_content).get('events', []):
+        text = ''.join(segment.get('utf8', '') for segment in event.get('segs', [])).replace('\n', ' ').strip()
+        if not text:
+            continue
+        transcript.append({
+            'text': text,
+            'start': event.get('tStartMs', 0) / 1000,
+            'duration': event.get('dDurationMs', 0) / 1000
+        })
+    return transcript
 
 def parse_srt(srt_content: str) -> List[Dict[str, Any]]:
     """Parses SRT content into a list of transcript entries."""
@@ -114,15 +191,60 @@ def parse_srt(srt_content: str) -> List[Dict[str, Any]]:
         })
     return transcript
 
+def to_seconds(value: Any) -> float:
+    """Converts float seconds or an "HH:MM:SS,mmm" / "HH:MM:SS.mmm" timestamp to seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    hours, minutes, seconds = value.strip().replace(',', '.').split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+class TranscriptIndex:
+    """Transcript entries sorted by start time with numeric start/end arrays for interval lookups."""
+
+    def __init__(self, transcript: List[Dict[str, Any]]):
+        starts = np.fromiter((to_seconds(entry['start']) for entry in transcript), dtype=np.float64, count=len(transcript))
+        ends = np.fromiter(
+            (to_seconds(entry['end']) if 'end' in entry else to_seconds(entry['start']) + float(entry.get('duration', 0)) for entry in transcript),
+            dtype=np.float64, count=len(transcript)
+        )
+        order = np.argsort(starts, kind='stable')
+        self.entries = [transcript[i] for i in order]
+        self.starts = starts[order]
+        self.ends = np.maximum(ends[order], self.starts)
+        self.max_length = float((self.ends - self.starts).max()) if len(transcript) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _candidate_bounds(self, window_starts: np.ndarray, window_ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # No entry starting before `window_start - max_length` can still be running at `window_start`
+        lower = np.searchsorted(self.starts, window_starts - self.max_length, side='left')
+        upper = np.searchsorted(self.starts, window_ends, side='right')
+        return lower, upper
+
+    def overlapping(self, window_start: float, window_end: float) -> List[Dict[str, Any]]:
+        """Returns the entries whose [start, end] interval overlaps the window, in time order."""
+        return self.overlapping_many([(window_start, window_end)])[0]
+
+    def overlapping_many(self, windows: Sequence[Tuple[float, float]]) -> List[List[Dict[str, Any]]]:
+        """Maps every window to its overlapping entries with one vectorized bounds lookup."""
+        if not windows:
+            return []
+        window_starts = np.array([window[0] for window in windows], dtype=np.float64)
+        window_ends = np.array([window[1] for window in windows], dtype=np.float64)
+        lower, upper = self._candidate_bounds(window_starts, window_ends)
+        sections = []
+        for window_start, low, high in zip(window_starts, lower.tolist(), upper.tolist()):
+            hits = np.flatnonzero(self.ends[low:high] >= window_start) + low
+            sections.append([self.entries[i] for i in hits.tolist()])
+        return sections
+
 def get_significant_transcript_sections(transcript: Optional[List[Dict[str, any]]], analysis_data: Dict[str, any]) -> Dict[str, List[List[Dict[str, any]]]]:
     if not transcript:
-        print("Transcript is unavailable. Returning empty significant sections.")
+        get_reporter().warning("Transcript is unavailable. Returning empty significant sections.")
         return {'rises': [], 'falls': []}
-    significant_sections = {'rises': [], 'falls': []}
-    for rise in analysis_data.get('significant_rises', []):
-        rise_transcript = [entry for entry in transcript if rise['start'] <= entry['start'] <= rise['end']]
-        significant_sections['rises'].append(rise_transcript)
-    for fall in analysis_data.get('significant_falls', []):
-        fall_transcript = [entry for entry in transcript if fall['start'] <= entry['start'] <= fall['end']]
-        significant_sections['falls'].append(fall_transcript)
-    return significant_sections
\ No newline at end of file
+    index = transcript if isinstance(transcript, TranscriptIndex) else TranscriptIndex(transcript)
+    rises = analysis_data.get('significant_rises', [])
+    falls = analysis_data.get('significant_falls', [])
+    sections = index.overlapping_many([(window['start'], window['end']) for window in rises + falls])
+    return {'rises': sections[:len(rises)], 'falls': sections[len(rises):]}
@@ -1,40 +1,150 @@
+import io
 import json
-from zipfile import ZipFile
-from io import BytesIO
-from typing import List, Dict, Any
+import os
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+from typing import List, Dict, Any, Iterator, Optional
+from transcript import to_seconds
 
-def download_clips_as_zip(clips: List[Dict[str, Any]]) -> BytesIO:
-    zip_buffer = BytesIO()
-    with ZipFile(zip_buffer, 'w') as zip_file:
-        for clip in clips:
-            clip_filename = f"{clip['video_id']}_{clip['start']}_{clip['end']}.txt"
-            clip_content = f"Transcript:\n{clip['transcript']}"
-            zip_file.writestr(clip_filename, clip_content)
-    zip_buffer.seek(0)
-    return zip_buffer
+# Read size when copying clip media into an archive
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+# Upper bounds on the ZIP64 bookkeeping bytes: per entry (local header, data descriptor,
+# central directory record and deflate overhead, excluding the name) and per archive (end records)
+ZIP_ENTRY_OVERHEAD = 256
+ZIP_END_OVERHEAD = 128
 
 def save_json(data: Dict[str, Any], file_path: str) -> None:
     with open(file_path, 'w', encoding='utf-8') as json_file:
         json.dump(data, json_file, indent=4)
 
-def generate_srt(transcript: List[Dict[str, Any]]) -> str:
+def format_srt_timestamp(seconds: float) -> str:
+    milliseconds = int(round(max(0.0, seconds) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    return f"{hours:02d}:{minutes:02d}:{milliseconds // 1000:02d},{milliseconds % 1000:03d}"
+
+def generate_srt(transcript: List[Dict[str, Any]], offset: float = 0.0) -> str:
+    """Builds SRT text from parsed SRT entries (`start`/`end`) or API/json3 entries (`start`/`duration`).
+
+    Times are shifted by `offset`, so passing the clip start makes them relative to the clip.
+    """
     srt_content = ""
     for i, entry in enumerate(transcript):
-        start_time = entry['start']
-        end_time = entry['end']
+        start_time = to_seconds(entry['start'])
+        end_time = to_seconds(entry['end']) if 'end' in entry else start_time + float(entry.get('duration', 0.0))
         text = entry['text']
-        srt_content += f"{i+1}\n{start_time} --> {end_time}\n{text}\n\n"
+        srt_content += f"{i+1}\n{format_srt_timestamp(start_time - offset)} --> {format_srt_timestamp(end_time - offset)}\n{text}\n\n"
     return srt_content
 
-def download_clips_with_srt_as_zip(clips: List[Dict[str, Any]]) -> BytesIO:
-    zip_buffer = BytesIO()
-    with ZipFile(zip_buffer, 'w') as zip_file:
+def _clip_basename(clip: Dict[str, Any]) -> str:
+    return f"{clip['video_id']}_{clip['start']}_{clip['end']}"
+
+def _zip_info(name: str, compress_type: int) -> ZipInfo:
+    info = ZipInfo(name)
+    info.compress_type = compress_type
+    return info
+
+def _clip_srt(clip: Dict[str, Any]) -> str:
+    return generate_srt(clip['transcript'] or [], offset=float(clip['start']))
+
+def _clip_media_name(clip: Dict[str, Any]) -> str:
+    return _clip_basename(clip) + os.path.splitext(clip['output_path'])[1]
+
+def _iter_clip_entries(zip_file: ZipFile, clip: Dict[str, Any], include_srt: bool = True) -> Iterator[None]:
+    """Writes the clip media into the archive chunk by chunk, then its SRT, pausing after each write."""
+    media_path = clip['output_path']
+    media_name = _clip_media_name(clip)
+    # Encoded video does not shrink under deflate, so store it as-is
+    with open(media_path, 'rb') as source, zip_file.open(_zip_info(media_name, ZIP_STORED), 'w', force_zip64=True) as target:
+        for chunk in iter(lambda: source.read(ZIP_CHUNK_SIZE), b''):
+            target.write(chunk)
+            yield
+    if include_srt:
+        zip_file.writestr(_zip_info(_clip_basename(clip) + '.srt', ZIP_DEFLATED), _clip_srt(clip))
+        yield
+
+def _write_clip_entries(zip_file: ZipFile, clip: Dict[str, Any], include_srt: bool = True) -> None:
+    for _ in _iter_clip_entries(zip_file, clip, include_srt):
+        pass
+
+def _clip_entry_size(clip: Dict[str, Any], include_srt: bool = True) -> int:
+    """Upper bound on the archive bytes the clip's entries take, including headers and central directory records."""
+    size = os.path.getsize(clip['output_path']) + len(_clip_media_name(clip).encode('utf-8')) * 2 + ZIP_ENTRY_OVERHEAD
+    if include_srt:
+        size += len(_clip_srt(clip).encode('utf-8')) + len((_clip_basename(clip) + '.srt').encode('utf-8')) * 2 + ZIP_ENTRY_OVERHEAD
+    return size
+
+def write_clips_zip(clips: List[Dict[str, Any]], archive_path: str, include_srt: bool = True, max_archive_bytes: Optional[int] = None) -> List[str]:
+    """Writes clips and their SRTs to ZIP archives on disk with bounded memory use.
+
+    When `max_archive_bytes` is set, clips are split across `<name>.partN.zip`
+    archives so that no part exceeds it (a single larger clip gets its own
+    part), counting headers, SRT files and the central directory. Returns the
+    archive paths written.
+    """
+    base, extension = os.path.splitext(archive_path)
+    archive_paths = []
+    zip_file = None
+    current_bytes = 0
+    try:
+        for clip in clips:
+            clip_bytes = _clip_entry_size(clip, include_srt)
+            if zip_file is not None and max_archive_bytes and current_bytes + clip_bytes + ZIP_END_OVERHEAD > max_archive_bytes:
+                zip_file.close()
+                zip_file = None
+            if zip_file is None:
+                path = archive_path if not max_archive_bytes else f"{base}.part{len(archive_paths) + 1}{extension or '.zip'}"
+                zip_file = ZipFile(path, 'w', allowZip64=True)
+                archive_paths.append(path)
+                current_bytes = 0
+            _write_clip_entries(zip_file, clip, include_srt)
+            current_bytes += clip_bytes
+    except BaseException:
+        if zip_file is not None:
+            zip_file.close()
+            zip_file = None
+        # A half-written export is worse than none, so drop every part of it
+        for path in archive_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    finally:
+        if zip_file is not None:
+            zip_file.close()
+    return archive_paths
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable write target that collects archive bytes until they are drained."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_clips_zip(clips: List[Dict[str, Any]], include_srt: bool = True) -> Iterator[bytes]:
+    """Yields a ZIP archive of the clips as byte chunks, e.g. for a chunked HTTP response."""
+    sink = _ChunkSink()
+    with ZipFile(sink, 'w', allowZip64=True) as zip_file:
         for clip in clips:
-            clip_filename = f"{clip['video_id']}_{clip['start']}_{clip['end']}.webm"
-            srt_filename = f"{clip['video_id']}_{clip['start']}_{clip['end']}.srt"
-            clip_content = f"Transcript:\n{clip['transcript']}"
-            srt_content = generate_srt(clip['transcript'])
-            zip_file.writestr(clip_filename, clip_content)
-            zip_file.writestr(srt_filename, srt_content)
-    zip_buffer.seek(0)
-    return zip_buffer
\ No newline at end of file
+            for _ in _iter_clip_entries(zip_file, clip, include_srt):
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
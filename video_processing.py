@@ -1,62 +1,238 @@
+import functools
 import subprocess
-from typing import List, Dict, Any
-from youtubesearchpython import Playlist, Channel, ResultMode
+import sys
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Dict, Any, Optional, Tuple
 import os
+from metrics import run_measured
+from reporting import get_reporter
+from sources import channel_playlist_url, dedupe, iter_playlist_pages
 
-def download_video(video_url: str, output_path: str) -> str:
+DOWNLOAD_MODES = ("full", "sections")
+
+DEFAULT_DOWNLOAD_HEIGHT = 720
+
+# Seconds fetched on each side of a planned clip so later cuts have room to seek
+SECTION_PADDING = 2.0
+
+def download_format(height: int = DEFAULT_DOWNLOAD_HEIGHT) -> str:
+    return f"bv*[height<={height}]+ba/b[height<={height}]/b"
+
+def download_video(video_url: str, output_path: str, height: int = DEFAULT_DOWNLOAD_HEIGHT,
+                   on_start: Optional[Callable[[subprocess.Popen], None]] = None) -> Optional[str]:
+    """Downloads the whole video to `output_path` with yt-dlp; `on_start` receives the yt-dlp process."""
+    command = [sys.executable, '-m', 'yt_dlp', '--quiet', '--no-warnings', '--no-playlist', '-f', download_format(height),
+               '--merge-output-format', 'mp4', '-o', output_path, video_url]
     try:
-        command = f'pytubepp "{video_url}"'
-        subprocess.run(command, shell=True, check=True)
+        run_measured(command, 'download', on_start=on_start)
         return output_path
     except subprocess.CalledProcessError as e:
-        print(f"pytubepp failed: {e}")
+        get_reporter().error(f"yt-dlp download failed: {e}")
         return None
 
-def create_clip(input_path: str, start_time: float, end_time: float, output_path: str) -> None:
-    duration = end_time - start_time
-    command = [
-        'ffmpeg',
-        '-i', input_path,
-        '-ss', str(start_time),
-        '-t', str(duration),
-        '-c:v', 'libvpx-vp9',
-        '-crf', '0',
-        '-b:v', '0',
-        '-c:a', 'libopus',
-        output_path
-    ]
-    subprocess.run(command, check=True)
-
-def create_clips(video_id: str, significant_sections: Dict[str, List[Dict[str, Any]]], input_path: str, output_dir: str) -> List[Dict[str, Any]]:
+def download_sections(video_url: str, windows: List[Dict[str, Any]], output_base: str, padding: float = SECTION_PADDING,
+                      height: int = DEFAULT_DOWNLOAD_HEIGHT) -> List[Dict[str, Any]]:
+    """Downloads only the padded `windows` of a video, one file per (merged) window.
+
+    Keyframes are forced at the cut points, so each file starts exactly at its
+    section's `start` and clip times can be rebased by subtracting it. Returns
+    `{'start', 'end', 'path'}` per downloaded section, or an empty list on failure.
+    """
+    padded = merge_sections([{'start': max(0.0, window['start'] - padding), 'end': window['end'] + padding, 'text': []} for window in windows])
+    if not padded:
+        return []
+    paths_file = f"{output_base}.sections.txt"
+    command = [sys.executable, '-m', 'yt_dlp', '--quiet', '--no-warnings', '--no-playlist', '-f', download_format(height),
+               '--merge-output-format', 'mp4', '--force-keyframes-at-cuts',
+               '-o', f"{output_base}.%(section_start)s.%(ext)s",
+               '--print-to-file', 'after_move:%(section_start)s\t%(section_end)s\t%(filepath)s', paths_file]
+    for section in padded:
+        command += ['--download-sections', f"*{section['start']}-{section['end']}"]
+    command.append(video_url)
+    try:
+        run_measured(command, 'download')
+        with open(paths_file, encoding='utf-8') as listing:
+            rows = [line.rstrip('\n').split('\t', 2) for line in listing if line.strip()]
+    except (subprocess.CalledProcessError, OSError) as e:
+        get_reporter().error(f"yt-dlp section download failed: {e}")
+        return []
+    finally:
+        if os.path.exists(paths_file):
+            os.remove(paths_file)
+    return [{'start': float(start), 'end': float(end), 'path': path} for start, end, path in rows]
+
+CUT_MODES = ("copy", "fast", "exact")
+
+# How far before the requested start the exact mode seeks on the input before decoding to the frame
+EXACT_SEEK_MARGIN = 5.0
+
+@dataclass(frozen=True)
+class EncoderSettings:
+    video_codec: str = 'libvpx-vp9'
+    audio_codec: str = 'libopus'
+    crf: int = 32
+    preset: Optional[str] = None
+    extra_args: Tuple[str, ...] = ('-b:v', '0', '-deadline', 'realtime', '-cpu-used', '8', '-row-mt', '1')
+    extension: str = 'webm'
+
+    def args(self) -> List[str]:
+        args = ['-c:v', self.video_codec, '-crf', str(self.crf)]
+        if self.preset:
+            args += ['-preset', self.preset]
+        return args + list(self.extra_args) + ['-c:a', self.audio_codec]
+
+@dataclass(frozen=True)
+class ClipSpec:
+    """Everything needed to cut one clip, including how it is encoded.
+
+    `copy` seeks on the input and stream-copies (cuts snap to keyframes),
+    `fast` seeks on the input and re-encodes with `encoder`, and `exact` seeks
+    coarsely on the input then decodes to the precise start frame.
+    """
+    input_path: str
+    start: float
+    end: float
+    output_path: str
+    mode: str = 'fast'
+    encoder: EncoderSettings = field(default_factory=EncoderSettings)
+
+    def __post_init__(self):
+        if self.mode not in CUT_MODES:
+            raise ValueError(f"Unsupported cut mode: {self.mode}")
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+def build_clip_command(spec: ClipSpec) -> List[str]:
+    if spec.mode == 'copy':
+        return ['ffmpeg', '-y', '-ss', str(spec.start), '-i', spec.input_path, '-t', str(spec.duration),
+                '-c', 'copy', '-avoid_negative_ts', 'make_zero', spec.output_path]
+    if spec.mode == 'fast':
+        return ['ffmpeg', '-y', '-ss', str(spec.start), '-i', spec.input_path, '-t', str(spec.duration),
+                *spec.encoder.args(), spec.output_path]
+    coarse_start = max(0.0, spec.start - EXACT_SEEK_MARGIN)
+    return ['ffmpeg', '-y', '-ss', str(coarse_start), '-i', spec.input_path, '-ss', str(spec.start - coarse_start),
+            '-t', str(spec.duration), *spec.encoder.args(), spec.output_path]
+
+def run_clip_spec(spec: ClipSpec, video_id: Optional[str] = None) -> str:
+    run_measured(build_clip_command(spec), 'ffmpeg', video_id)
+    return spec.output_path
+
+def create_clip(input_path: str, start_time: float, end_time: float, output_path: str, mode: str = 'fast', encoder: Optional[EncoderSettings] = None) -> None:
+    run_clip_spec(ClipSpec(input_path, start_time, end_time, output_path, mode, encoder or EncoderSettings()))
+
+def clip_extension(input_path: str, mode: str, encoder: EncoderSettings) -> str:
+    # Stream copy keeps the source codecs, so it has to keep the source container too
+    if mode == 'copy':
+        return os.path.splitext(input_path)[1].lstrip('.') or 'mp4'
+    return encoder.extension
+
+def merge_sections(sections: List[Dict[str, Any]], gap: float = 0.0) -> List[Dict[str, Any]]:
+    """Merges overlapping or adjacent (within `gap` seconds) sections, combining their transcript entries."""
+    merged = []
+    for section in sorted(sections, key=lambda item: item['start']):
+        if merged and section['start'] <= merged[-1]['end'] + gap:
+            previous = merged[-1]
+            previous['end'] = max(previous['end'], section['end'])
+            previous['text'] = previous['text'] + [entry for entry in section['text'] if entry not in previous['text']]
+        else:
+            merged.append({'start': section['start'], 'end': section['end'], 'text': list(section['text'])})
+    return merged
+
+def build_multi_clip_command(specs: List[ClipSpec]) -> List[str]:
+    """Builds one ffmpeg invocation that writes every clip of a single source.
+
+    Each clip opens the source as its own input with an input-side seek, so
+    only the clip ranges are read and decoded (not everything between the
+    first and last clip), while one process still produces every output.
+    Exact mode seeks coarsely on the input and finishes with an output seek.
+    """
+    inputs = []
+    outputs = []
+    for i, spec in enumerate(specs):
+        if spec.mode == 'exact':
+            coarse_start = max(0.0, spec.start - EXACT_SEEK_MARGIN)
+            inputs += ['-ss', str(coarse_start), '-t', str(spec.end - coarse_start), '-i', spec.input_path]
+            outputs += ['-ss', str(spec.start - coarse_start), '-t', str(spec.duration)]
+        else:
+            inputs += ['-ss', str(spec.start), '-t', str(spec.duration), '-i', spec.input_path]
+        if spec.mode == 'copy':
+            outputs += ['-map', str(i), '-c', 'copy', '-avoid_negative_ts', 'make_zero', spec.output_path]
+        else:
+            outputs += ['-map', f'{i}:v:0', '-map', f'{i}:a:0?', *spec.encoder.args(), spec.output_path]
+    return ['ffmpeg', '-y', *inputs, *outputs]
+
+def run_multi_clip_specs(specs: List[ClipSpec], video_id: Optional[str] = None) -> List[str]:
+    if specs:
+        run_measured(build_multi_clip_command(specs), 'ffmpeg', video_id)
+    return [spec.output_path for spec in specs]
+
+def create_clips(video_id: str, significant_sections: Dict[str, List[Dict[str, Any]]], input_path: str, output_dir: str,
+                 mode: str = 'fast', encoder: Optional[EncoderSettings] = None, executor: Optional[Executor] = None,
+                 single_pass: bool = False, merge_gap: float = 0.0, offset: float = 0.0) -> List[Dict[str, Any]]:
+    """Cuts every rise into a clip, running the ffmpeg jobs on a bounded worker pool.
+
+    Pass a shared `executor` to bound ffmpeg processes across several videos;
+    otherwise a pool sized to the CPU count is used for this call. With
+    `single_pass`, overlapping or adjacent rises are merged first and all clips
+    are written by one ffmpeg process that seeks to each clip range.
+    `offset` is the video time at which `input_path` starts, for sources that
+    only hold a section of the video; clip times stay in video time.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    encoder = encoder or EncoderSettings()
+    extension = clip_extension(input_path, mode, encoder)
+    sections = significant_sections['rises']
+    if single_pass:
+        sections = merge_sections(sections, merge_gap)
+    specs = []
     clips = []
-    for section in significant_sections['rises']:
+    for section in sections:
         start = section['start']
         end = section['end']
-        output_path = f"{output_dir}/{video_id}_{start}_{end}.webm"
-        create_clip(input_path, start, end, output_path)
+        output_path = f"{output_dir}/{video_id}_{start}_{end}.{extension}"
+        specs.append(ClipSpec(input_path, start - offset, end - offset, output_path, mode, encoder))
         clip = {
             'video_id': video_id,
             'start': start,
             'end': end,
             'transcript': section['text'],
-            'output_path': output_path
+            'output_path': output_path,
+            'mode': mode
         }
         clips.append(clip)
+
+    run_spec = functools.partial(run_clip_spec, video_id=video_id)
+    if single_pass:
+        if executor is not None:
+            executor.submit(run_multi_clip_specs, specs, video_id).result()
+        else:
+            run_multi_clip_specs(specs, video_id)
+    elif executor is not None:
+        list(executor.map(run_spec, specs))
+    elif specs:
+        with ThreadPoolExecutor(max_workers=min(len(specs), os.cpu_count() or 1)) as local_executor:
+            list(local_executor.map(run_spec, specs))
     return clips
 
+def create_clips_from_sections(video_id: str, significant_sections: Dict[str, List[Dict[str, Any]]], downloaded: List[Dict[str, Any]],
+                               output_dir: str, **kwargs) -> List[Dict[str, Any]]:
+    """Cuts each rise from the downloaded section that contains it (see `download_sections`)."""
+    clips = []
+    remaining = list(significant_sections['rises'])
+    for source in downloaded:
+        inside = [section for section in remaining if source['start'] <= section['start'] and section['end'] <= source['end']]
+        if inside:
+            clips += create_clips(video_id, {'rises': inside}, source['path'], output_dir, offset=source['start'], **kwargs)
+            remaining = [section for section in remaining if section not in inside]
+    if remaining:
+        get_reporter().warning(f"{len(remaining)} clip(s) of video ID {video_id} were not covered by the downloaded sections")
+    return sorted(clips, key=lambda clip: clip['start'])
+
 def get_video_ids_from_playlist(playlist_url: str) -> List[str]:
-    playlist = Playlist.getVideos(playlist_url)
-    video_ids = [video['id'] for video in playlist['videos']]
-    while playlist['hasMoreVideos']:
-        playlist = Playlist.getNextVideos()
-        video_ids.extend([video['id'] for video in playlist['videos']])
-    return video_ids
+    return dedupe(video_id for page in iter_playlist_pages(playlist_url) for video_id in page)
 
 def get_video_ids_from_channel(channel_url: str) -> List[str]:
-    channel_id = channel_url.split('/')[-1]
-    playlist = Playlist(playlist_from_channel_id(channel_id))
-    video_ids = [video['id'] for video in playlist.videos]
-    while playlist.hasMoreVideos:
-        playlist.getNextVideos()
-        video_ids.extend([video['id'] for video in playlist.videos])
-    return video_ids
+    return get_video_ids_from_playlist(channel_playlist_url(channel_url))
@@ -0,0 +1,113 @@
+import json
+import logging
+import random
+import urllib.request
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from browser_pool import USER_AGENTS
+
+WATCH_URL = "https://www.youtube.com/watch?v={video_id}"
+
+INITIAL_DATA_MARKERS = ("var ytInitialData = ", "window[\"ytInitialData\"] = ", "ytInitialData = ")
+
+PLAYER_RESPONSE_MARKERS = ("var ytInitialPlayerResponse = ", "ytInitialPlayerResponse = ")
+
+
+def fetch_watch_page(video_id: str, timeout: float = 15.0) -> str:
+    """Downloads the raw watch-page HTML without rendering it."""
+    request = urllib.request.Request(WATCH_URL.format(video_id=video_id), headers={
+        'User-Agent': random.choice(USER_AGENTS),
+        'Accept-Language': 'en-US,en;q=0.9',
+        'Cookie': 'CONSENT=YES+1',
+    })
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        charset = response.headers.get_content_charset() or 'utf-8'
+        return response.read().decode(charset, errors='replace')
+
+
+def extract_embedded_json(page_html: str, markers: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    """Decodes the first JSON object assigned after any of `markers` in the page source."""
+    decoder = json.JSONDecoder()
+    for marker in markers:
+        index = page_html.find(marker)
+        if index == -1:
+            continue
+        try:
+            data, _ = decoder.raw_decode(page_html, index + len(marker))
+            return data
+        except json.JSONDecodeError as e:
+            logging.warning(f"Failed to decode embedded JSON after {marker!r}: {e}")
+    return None
+
+
+def _walk(node: Any) -> Iterator[Dict[str, Any]]:
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, dict):
+            yield current
+            stack.extend(current.values())
+        elif isinstance(current, list):
+            stack.extend(current)
+
+
+def _heat_markers(initial_data: Dict[str, Any]) -> List[Tuple[float, float, float]]:
+    """Returns (start_seconds, length_seconds, intensity) for every most-replayed marker.
+
+    Handles both the legacy `heatMarkerRenderer` list and the newer
+    `macroMarkersListEntity` mutation payload.
+    """
+    markers = []
+    for node in _walk(initial_data):
+        renderer = node.get('heatMarkerRenderer')
+        if isinstance(renderer, dict) and 'timeRangeStartMillis' in renderer:
+            markers.append((
+                float(renderer['timeRangeStartMillis']) / 1000,
+                float(renderer.get('markerDurationMillis', 0)) / 1000,
+                float(renderer.get('heatMarkerIntensityScoreNormalized', 0))
+            ))
+        entity = node.get('macroMarkersListEntity')
+        if isinstance(entity, dict):
+            markers_list = entity.get('markersList', {})
+            if markers_list.get('markerType') not in (None, 'MARKER_TYPE_HEATMAP'):
+                continue
+            for marker in markers_list.get('markers', []):
+                if 'startMillis' in marker:
+                    markers.append((
+                        float(marker['startMillis']) / 1000,
+                        float(marker.get('durationMillis', 0)) / 1000,
+                        float(marker.get('intensityScoreNormalized', 0))
+                    ))
+    return sorted(set(markers))
+
+
+def parse_most_replayed(page_html: str) -> Optional[Tuple[List[Dict[str, float]], float]]:
+    """Extracts heatmap points and the video duration from watch-page HTML.
+
+    Points use the same `{'Attention', 'duration'}` shape as `parse_svg_heatmap`,
+    with attention scaled to 0-100. Returns `([], duration)` when the page
+    decoded but the video has no most-replayed data, and None when the
+    embedded JSON could not be found or decoded.
+    """
+    player_response = extract_embedded_json(page_html, PLAYER_RESPONSE_MARKERS) or {}
+    video_duration = float(player_response.get('videoDetails', {}).get('lengthSeconds', 0) or 0)
+
+    initial_data = extract_embedded_json(page_html, INITIAL_DATA_MARKERS)
+    if not initial_data:
+        return None
+
+    markers = _heat_markers(initial_data)
+    heatmap_points = [{'Attention': intensity * 100, 'duration': start} for start, _, intensity in markers]
+    if markers and not video_duration:
+        last_start, last_length, _ = markers[-1]
+        video_duration = last_start + last_length
+    return heatmap_points, video_duration
+
+
+def fetch_most_replayed(video_id: str) -> Optional[Tuple[List[Dict[str, float]], float]]:
+    """Like `parse_most_replayed`, but also returns None when the page could not be fetched."""
+    try:
+        page_html = fetch_watch_page(video_id)
+    except OSError as e:
+        logging.warning(f"Watch page fetch failed for video ID {video_id}: {e}")
+        return None
+    return parse_most_replayed(page_html)
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from typing import Iterable, List, Optional, Set, Tuple
+
+DEFAULT_WORKSPACE_DIR = ".work"
+
+DEFAULT_QUOTA_BYTES = 20 * 1024 ** 3
+
+# Space assumed per active source, since a download's final size is unknown until it finishes
+DEFAULT_RESERVE_BYTES = 512 * 1024 ** 2
+
+# Job directories written to more recently than this may belong to a running job, so their scratch files are never evicted
+EVICTION_MIN_IDLE_SECONDS = 15 * 60
+
+
+def directory_size(path: str) -> int:
+    """Total size of the regular files below `path`; files removed while walking are ignored."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def _last_modified(path: str) -> float:
+    latest = os.path.getmtime(path)
+    for root, directories, files in os.walk(path):
+        for name in directories + files:
+            try:
+                latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+            except OSError:
+                continue
+    return latest
+
+
+def _scratch_paths(job_dir: str) -> List[str]:
+    """Evictable files of a job directory: its sources and the ZIP archives written next to them."""
+    paths = []
+    with os.scandir(job_dir) as entries:
+        for entry in entries:
+            if (entry.name == "sources" and entry.is_dir(follow_symlinks=False)) or (entry.name.endswith('.zip') and entry.is_file(follow_symlinks=False)):
+                paths.append(entry.path)
+    return paths
+
+
+class Workspace:
+    """Scratch space for one batch job, kept under a disk quota.
+
+    Sources are downloaded into `sources_dir` and clips are written to
+    `clips_dir`, both inside a per-job directory under `root`. Downloads start
+    with `acquire`, which waits while the workspace (plus `reserve_bytes` per
+    active source) would exceed `high_watermark` of the quota, and sources are
+    deleted with `release` once their clips exist. The quota covers the whole
+    root: the scratch files of idle jobs (leftover sources and the app's ZIP
+    archives) are evicted, least recently used first, when the workspace is
+    prepared and whenever a download would have to wait for space. Clips are
+    deliverables and are never evicted.
+    """
+
+    def __init__(self, root: str = DEFAULT_WORKSPACE_DIR, job_id: str = "default", quota_bytes: int = DEFAULT_QUOTA_BYTES,
+                 reserve_bytes: int = DEFAULT_RESERVE_BYTES, high_watermark: float = 0.9, poll_interval: float = 2.0,
+                 keep_sources: bool = False):
+        self.root = root
+        self.job_dir = os.path.join(root, job_id)
+        self.sources_dir = os.path.join(self.job_dir, "sources")
+        self.clips_dir = os.path.join(self.job_dir, "clips")
+        self.quota_bytes = quota_bytes
+        self.reserve_bytes = reserve_bytes
+        self.high_watermark = high_watermark
+        self.poll_interval = poll_interval
+        self.keep_sources = keep_sources
+        self._holds: Set[str] = set()
+        self._condition: Optional[asyncio.Condition] = None
+
+    def prepare(self) -> "Workspace":
+        os.makedirs(self.sources_dir, exist_ok=True)
+        os.makedirs(self.clips_dir, exist_ok=True)
+        self.evict_other_jobs()
+        return self
+
+    def source_path(self, name: str) -> str:
+        return os.path.join(self.sources_dir, name)
+
+    def usage(self) -> int:
+        """Bytes currently on disk under the workspace root, across all jobs."""
+        return directory_size(self.root)
+
+    def _other_jobs(self) -> List[Tuple[float, str]]:
+        """(last modified, path) of the other job directories under the root, oldest first."""
+        jobs = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False) and entry.path != self.job_dir:
+                    try:
+                        jobs.append((_last_modified(entry.path), entry.path))
+                    except OSError:
+                        continue
+        return sorted(jobs)
+
+    def evict_other_jobs(self) -> int:
+        """Deletes the scratch files of idle jobs, oldest first, until usage is below `high_watermark` of the quota.
+
+        Only `sources/` and top-level ZIP archives are removed; `clips/` may be
+        a previous run's output and is kept. Returns the bytes freed. The
+        current job is never touched.
+        """
+        limit = self.quota_bytes * self.high_watermark
+        usage = self.usage()
+        freed = 0
+        if usage <= limit:
+            return freed
+        for modified, job_dir in self._other_jobs():
+            if usage - freed <= limit or time.time() - modified < EVICTION_MIN_IDLE_SECONDS:
+                break
+            for path in _scratch_paths(job_dir):
+                try:
+                    if os.path.isdir(path):
+                        size = directory_size(path)
+                        shutil.rmtree(path)
+                    else:
+                        size = os.path.getsize(path)
+                        os.remove(path)
+                except OSError as e:
+                    logging.warning(f"Could not evict {path}: {e}")
+                    continue
+                logging.info(f"Evicted {path} ({size} bytes) to stay under the disk quota")
+                freed += size
+        return freed
+
+    def _has_room(self) -> bool:
+        # Each active source may still grow by up to reserve_bytes, and so may the one about to start
+        return self.usage() + (len(self._holds) + 1) * self.reserve_bytes <= self.quota_bytes * self.high_watermark
+
+    async def acquire(self, key: str) -> None:
+        """Waits until the quota leaves room for one more source, then holds space for it under `key`.
+
+        Acquiring a key that is already held returns at once, so retried
+        downloads do not queue behind themselves. When no other source is
+        active nothing could free space, so the download goes ahead with a
+        warning instead of waiting forever.
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            if key in self._holds:
+                return
+            waited = False
+            if not await asyncio.to_thread(self._has_room):
+                await asyncio.to_thread(self.evict_other_jobs)
+            while self._holds and not await asyncio.to_thread(self._has_room):
+                if not waited:
+                    logging.info(f"Workspace near quota, pausing download for {key}")
+                    waited = True
+                try:
+                    await asyncio.wait_for(self._condition.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if not self._holds and not await asyncio.to_thread(self._has_room):
+                logging.warning(f"Workspace is above {self.high_watermark:.0%} of its quota; downloading {key} anyway")
+            self._holds.add(key)
+
+    async def release(self, key: str, paths: Iterable[str] = ()) -> None:
+        """Deletes the finished source files of `key` and wakes downloads waiting for space."""
+        if not self.keep_sources:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logging.warning(f"Could not remove source {path}: {e}")
+        if self._condition is None:
+            self._holds.discard(key)
+            return
+        async with self._condition:
+            self._holds.discard(key)
+            self._condition.notify_all()
+
+    def clear_sources(self) -> None:
+        """Removes anything left in `sources_dir`, e.g. downloads that finished after their video was skipped."""
+        if not self.keep_sources and os.path.isdir(self.sources_dir):
+            shutil.rmtree(self.sources_dir, ignore_errors=True)
+            os.makedirs(self.sources_dir, exist_ok=True)
+
+    def clear_clips(self) -> None:
+        """Removes the clips in `clips_dir`, e.g. once they have been exported to archives."""
+        if os.path.isdir(self.clips_dir):
+            shutil.rmtree(self.clips_dir, ignore_errors=True)
+            os.makedirs(self.clips_dir, exist_ok=True)
+
+    def remove(self) -> None:
+        """Deletes the whole job directory, including its clips."""
+        shutil.rmtree(self.job_dir, ignore_errors=True)